@@ -8,6 +8,7 @@ run_itty()
 # Same as above: run_itty(server='wsgiref')
 
 # Other options:
+# run_itty(server='threaded', threads=10, queue_size=64)
 # run_itty(server='tornado')
 # run_itty(server='diesel')
 # run_itty(server='twisted')
@@ -18,3 +19,5 @@ run_itty()
 # run_itty(server='gunicorn')
 # run_itty(server='gevent')
 # run_itty(server='eventlet')
+# run_itty(server='asyncio')
+# run_itty(server='prefork')
@@ -0,0 +1,18 @@
+import trollius as asyncio
+from trollius import From, Return
+from itty import *
+
+# Coroutine handlers wait on I/O without holding a thread. Under the asyncio
+# server, thousands can be in flight at once.
+@get('/wait/(?P<seconds>\d+)')
+@asyncio.coroutine
+def wait(request, seconds):
+    yield From(asyncio.sleep(int(seconds)))
+    raise Return('Waited %s seconds.' % seconds)
+
+# Regular handlers still work & run on a pool of threads.
+@get('/')
+def index(request):
+    return 'Hello World!'
+
+run_itty(server='asyncio')
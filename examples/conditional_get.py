@@ -0,0 +1,22 @@
+from itty import *
+
+ARTICLE_VERSION = 'v42'
+
+# Hash every buffered 200 into an ``ETag`` header. Clients that send it back
+# in ``If-None-Match`` get an empty 304 instead of the full body.
+enable_etags()
+
+@get('/')
+def index(request):
+    return 'Hello World!'
+
+# When the body is expensive to build, check a cheap validator first. If the
+# client is up to date, ``check_not_modified`` raises & a 304 goes out.
+@get('/article')
+def article(request):
+    request.check_not_modified(etag=ARTICLE_VERSION)
+    response = Response('A very expensive article, version %s.' % ARTICLE_VERSION)
+    response.set_etag(ARTICLE_VERSION)
+    return response
+
+run_itty()
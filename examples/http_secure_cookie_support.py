@@ -13,4 +13,7 @@ def response_cookies(request):
     response.set_secure_cookie('foo', 'bar')
     return response
 
+# Optional. Skips re-verifying the same signed cookie on every request.
+enable_signed_value_cache(maxsize=1024, ttl=300)
+
 run_itty(cookie_secret='MySeCrEtCoOkIe')
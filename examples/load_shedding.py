@@ -0,0 +1,27 @@
+import time
+from itty import *
+
+# At most 50 requests are handled at once (5 of them on /report). Anything
+# beyond that waits briefly for a slot, then gets a 503 with Retry-After.
+enable_admission_control(50, route_limits={'/report': 5}, retry_after=2)
+
+# To also lower the cap while responses are slow:
+# enable_admission_control(50, adaptive=True, target_latency=0.25)
+
+@get('/report')
+def report(request):
+    time.sleep(1)
+    return 'Expensive report.'
+
+@get('/')
+def index(request):
+    return 'Hello World!'
+
+# Customize the rejection like any other error.
+@error(503)
+def busy(request, exception):
+    response = Response('Busy, try again shortly.', status=503, content_type='text/plain',
+                        headers=[('Retry-After', str(exception.retry_after))])
+    return response.send(request._start_response)
+
+run_itty(server='threaded', threads=50)
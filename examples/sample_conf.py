@@ -1,4 +1,8 @@
 # itty Config
 host = 'localhost'
 port = 8080
-server = 'wsgiref'
\ No newline at end of file
+server = 'wsgiref'
+# Options for the built-in servers (see SERVER_OPTIONS), e.g.:
+# server = 'threaded'
+# threads = 10
+# queue_size = 64
@@ -39,6 +39,10 @@ def simple(request):
 # type. If needed, you can enforce a content type by using the
 # ``force_content_type`` kwarg (i.e. ``force_content_type='image/jpg'`` on a
 # directory of user uploaded images).
+#
+# Run ``precompress_static(MY_ROOT)`` as part of your deploy to write ``.gz``
+# copies of your CSS/JS. ``serve_static_file`` sends those to clients that
+# accept gzip, without compressing anything per request.
 @get('/simple_media/(?P<filename>.+)')
 def simple_media(request, filename):
     return serve_static_file(request, filename, root=MY_ROOT)
@@ -0,0 +1,20 @@
+from itty import *
+
+# Return a generator (or any other iterable) & the chunks are sent as they're
+# produced, rather than building the whole body in memory first.
+@get('/export.csv')
+def export(request):
+    def rows():
+        yield u'id,name\n'
+
+        for i in range(100000):
+            yield u'%d,item %d\n' % (i, i)
+
+    return Response(rows(), content_type='text/csv')
+
+# File-like objects are read & sent a block at a time.
+@get('/source')
+def source(request):
+    return Response(open(__file__, 'rb'), content_type='text/plain')
+
+run_itty()
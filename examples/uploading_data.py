@@ -1,3 +1,4 @@
+import shutil
 from itty import *
 
 @get('/upload')
@@ -10,9 +11,10 @@ def test_upload(request):
     
     if request.POST['myfile'].filename:
         myfilename = request.POST['myfile'].filename
-        myfile_contents = request.POST['myfile'].file.read()
-        uploaded_file = open(myfilename, 'w')
-        uploaded_file.write(myfile_contents)
+        # Large uploads are spooled to disk, so copy across in chunks rather
+        # than reading the whole thing into memory.
+        uploaded_file = open(myfilename, 'wb')
+        shutil.copyfileobj(request.POST['myfile'].file, uploaded_file)
         uploaded_file.close()
     
     html = """
@@ -4,4 +4,10 @@ from itty import *
 def test_get(request):
     return "'foo' is: %s" % request.GET.get('foo', 'not specified')
 
+# Repeated keys (``?tag=a&tag=b``) are all kept. Plain access returns the last
+# one, ``getlist`` returns every value.
+@get('/tags')
+def test_get_list(request):
+    return "'tag' is: %s" % ', '.join(request.GET.getlist('tag'))
+
 run_itty()
@@ -4,6 +4,12 @@ from itty import *
 def test_get(request, name=', world'):
     return 'Hello %s!' % name
 
+# Typed parameters are converted before your handler is called. Non-numeric
+# ids never match, so they 404 without ever reaching the handler.
+@get('/item/<int:item_id>')
+def test_typed(request, item_id):
+    return 'Item #%d (next is #%d).' % (item_id, item_id + 1)
+
 @post('/post')
 def test_post(request):
     return "'foo' is: %s" % request.POST.get('foo', 'not specified')
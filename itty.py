@@ -22,18 +22,28 @@ at night. The joking around has become reality. :)
 """
 import base64
 import cgi
+import collections
 import datetime
+import email.utils
+import gzip
 import hashlib
 import hmac
 import logging
 import mimetypes
 import numbers
 import os
+import random
 import re
+import socket
 import StringIO
 import sys
+import tempfile
+import threading
 import time
 import traceback
+import urllib
+import uuid
+import zlib
 try:
     from urlparse import parse_qs
 except ImportError:
@@ -50,6 +60,7 @@ __license__ = 'BSD'
 
 REQUEST_MAPPINGS = {
     'GET': [],
+    'HEAD': [],
     'POST': [],
     'PUT': [],
     'DELETE': [],
@@ -59,6 +70,25 @@ ERROR_HANDLERS = {}
 
 MEDIA_ROOT = os.path.join(os.path.dirname(__file__), 'media')
 
+# Request bodies are read in chunks of this many bytes.
+CHUNK_SIZE = 64 * 1024
+
+# Request bodies bigger than this (in bytes) get a 413. ``None`` for no limit.
+MAX_BODY_SIZE = None
+
+# Uploaded files bigger than this (in bytes) are spooled to a temporary file.
+MULTIPART_SPOOL_SIZE = 1024 * 1024
+
+# Non-file form fields bigger than this (in bytes) are rejected.
+MULTIPART_MAX_FIELD_SIZE = 1024 * 1024
+
+# Most of a multipart body (in bytes) kept in memory, across all its parts.
+# Past this, more form fields get a 413 & uploads go straight to disk.
+MULTIPART_MEMORY_LIMIT = 16 * 1024 * 1024
+
+# Static file requests asking for more byte ranges than this get the whole file.
+MAX_BYTE_RANGES = 16
+
 HTTP_MAPPINGS = {
     100: 'CONTINUE',
     101: 'SWITCHING PROTOCOLS',
@@ -113,6 +143,14 @@ class RequestError(Exception):
         self.hide_traceback = hide_traceback
 
 
+class BadRequest(RequestError):
+    status = 400
+
+    def __init__(self, message, hide_traceback=True):
+        super(BadRequest, self).__init__(message)
+        self.hide_traceback = hide_traceback
+
+
 class Forbidden(RequestError):
     status = 403
 
@@ -125,6 +163,14 @@ class NotFound(RequestError):
         self.hide_traceback = hide_traceback
 
 
+class RequestEntityTooLarge(RequestError):
+    status = 413
+
+    def __init__(self, message, hide_traceback=True):
+        super(RequestEntityTooLarge, self).__init__(message)
+        self.hide_traceback = hide_traceback
+
+
 class AppError(RequestError):
     status = 500
 
@@ -145,8 +191,46 @@ class Redirect(RequestError):
         self.args = ["Redirecting to '%s'..." % self.url]
 
 
+class NotModified(RequestError):
+    """
+    Tells the client its cached copy is still good (a 304).
+
+    Raised by ``Request.check_not_modified``, so handlers can bail out before
+    building an expensive body. ``headers`` & ``content_type`` are what the
+    full response would have had, so the 304 can repeat its caching headers.
+    """
+    status = 304
+    hide_traceback = True
+
+    def __init__(self, etag=None, last_modified=None, headers=None, content_type=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.content_type = content_type
+        self.args = ["Not modified."]
+
+
+class ServiceUnavailable(RequestError):
+    """
+    Tells the client to come back later (a 503).
+
+    Raised when the ``AdmissionController`` has no room for a request.
+    """
+    status = 503
+
+    def __init__(self, message, retry_after=None, hide_traceback=True):
+        super(ServiceUnavailable, self).__init__(message)
+        self.retry_after = retry_after
+        self.hide_traceback = hide_traceback
+
+
 class lazyproperty(object):
-    """A property whose value is computed only once. """
+    """
+    A property whose value is computed only once.
+
+    The value is stored on the instance. Classes using ``__slots__`` should
+    provide a ``_lazy`` slot, where the values get kept in a dict instead.
+    """
     def __init__(self, function):
         self._function = function
 
@@ -154,9 +238,83 @@ class lazyproperty(object):
         if obj is None:
             return self
 
-        value = self._function(obj)
-        setattr(obj, self._function.func_name, value)
-        return value
+        name = self._function.func_name
+
+        if hasattr(obj, '__dict__'):
+            value = self._function(obj)
+            setattr(obj, name, value)
+            return value
+
+        lazy = getattr(obj, '_lazy', None)
+
+        if lazy is None:
+            lazy = obj._lazy = {}
+
+        try:
+            return lazy[name]
+        except KeyError:
+            value = lazy[name] = self._function(obj)
+            return value
+
+    @staticmethod
+    def computed(obj, name):
+        """Returns whether the lazy value ``name`` has been computed on ``obj``."""
+        return name in (getattr(obj, '__dict__', None) or getattr(obj, '_lazy', None) or ())
+
+
+class LRUCache(object):
+    """
+    A bounded mapping that evicts the least recently used entries first.
+
+    Keeps ``hits``, ``misses`` & ``evictions`` counters so the size can be
+    tuned. Safe to share between threads.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # Re-insert to mark it as the most recently used.
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
 
 if hasattr(hmac, 'compare_digest'):  # python 3.3
     _time_independent_equals = hmac.compare_digest
@@ -230,6 +388,113 @@ def format_timestamp(ts):
     return time.strftime("%a, %d %b %Y %H:%M:%S GMT", ts)
 
 
+def parse_cookie(header):
+    """
+    Parses a ``Cookie`` request header into a dictionary of name -> value.
+
+    Much cheaper than ``Cookie.SimpleCookie.load``, as no ``Morsel`` objects
+    are created. As with ``SimpleCookie``, the last of any repeated names wins.
+    """
+    cookies = {}
+
+    for chunk in native_str(header).split(';'):
+        name, sep, value = chunk.partition('=')
+
+        if not sep:
+            continue
+
+        name = name.strip()
+        value = value.strip()
+
+        if not name or name.startswith('$'):
+            # Empty or RFC 2109 attributes (``$Path`` etc.).
+            continue
+
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = Cookie._unquote(value)
+
+        cookies[name] = value
+
+    return cookies
+
+
+def quote_etag(etag, weak=False):
+    """Wraps a validator in quotes (& the weak prefix), as the ``ETag`` header wants."""
+    if etag.startswith('"') or etag.startswith('W/"'):
+        return etag
+
+    etag = '"%s"' % etag
+
+    if weak:
+        etag = 'W/' + etag
+
+    return etag
+
+
+def parse_http_date(value):
+    """Returns the HTTP date as seconds since the epoch, or ``None`` if invalid."""
+    try:
+        parsed = email.utils.parsedate_tz(value)
+    except (TypeError, ValueError):
+        return None
+
+    if parsed is None:
+        return None
+
+    return email.utils.mktime_tz(parsed)
+
+
+def is_not_modified(request, etag=None, last_modified=None):
+    """
+    Checks the request's ``If-None-Match``/``If-Modified-Since`` headers
+    against a response's validators.
+
+    ``etag`` is the (quoted) ``ETag`` value and ``last_modified`` either a
+    timestamp or an HTTP date string. Returns ``True`` if a 304 can be sent.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if_none_match = request.headers.get('If-None-Match')
+
+    if if_none_match is not None:
+        # When present, this wins over ``If-Modified-Since``.
+        if etag is None:
+            return False
+
+        if if_none_match.strip() == '*':
+            return True
+
+        # Weak comparison. A compressed copy is still the same resource.
+        etag = etag[2:] if etag.startswith('W/') else etag
+
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+
+            if candidate == etag:
+                return True
+
+        return False
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    if isinstance(last_modified, basestring_type):
+        last_modified = parse_http_date(last_modified)
+
+    since = parse_http_date(if_modified_since)
+
+    if last_modified is None or since is None:
+        return False
+
+    return int(last_modified) <= since
+
+
 def create_signed_value(secret, name, value):
     timestamp = utf8(str(int(time.time())))
     value = base64.b64encode(utf8(value))
@@ -238,20 +503,75 @@ def create_signed_value(secret, name, value):
     return value
 
 
+SIGNED_VALUE_CACHE = None
+SIGNED_VALUE_CACHE_TTL = 300
+
+
+def enable_signed_value_cache(maxsize=1024, ttl=300):
+    """
+    Turns on caching of successfully verified signed values (i.e. session
+    cookies), so the same cookie isn't decoded & re-verified every request.
+
+    Accepts an optional ``maxsize`` (integer, number of values to keep) and
+    ``ttl`` (integer, seconds before a value must be verified again)
+    parameters. ``max_age_days`` is still checked on every hit. Passing
+    ``maxsize=None`` turns the cache back off.
+    """
+    global SIGNED_VALUE_CACHE, SIGNED_VALUE_CACHE_TTL
+
+    if maxsize is None:
+        SIGNED_VALUE_CACHE = None
+    else:
+        SIGNED_VALUE_CACHE = LRUCache(maxsize)
+        SIGNED_VALUE_CACHE_TTL = ttl
+
+    return SIGNED_VALUE_CACHE
+
+
 def decode_signed_value(secret, name, value, max_age_days=31):
     if not value:
         return None
+
+    cache = SIGNED_VALUE_CACHE
+
+    if cache is None:
+        return _decode_signed_value(secret, name, value, max_age_days)[1]
+
+    key = (secret, name, value)
+    cached = cache.get(key)
+    now = time.time()
+
+    if cached is not None:
+        expires, timestamp, decoded = cached
+
+        if now < expires and timestamp >= now - max_age_days * 86400:
+            return decoded
+
+        # Stale or too old for this caller. Go the long way round, so
+        # expiry gets logged as usual.
+        cache.pop(key)
+
+    timestamp, decoded = _decode_signed_value(secret, name, value, max_age_days)
+
+    if decoded is not None:
+        cache.set(key, (now + SIGNED_VALUE_CACHE_TTL, timestamp, decoded))
+
+    return decoded
+
+
+def _decode_signed_value(secret, name, value, max_age_days):
+    """Returns a ``(timestamp, decoded value)`` tuple. The value is ``None`` if invalid."""
     parts = utf8(value).split(b"|")
     if len(parts) != 3:
-        return None
+        return (None, None)
     signature = _create_signature(secret, name, parts[0], parts[1])
     if not _time_independent_equals(parts[2], signature):
         logging.warning("Invalid cookie signature %r", value)
-        return None
+        return (None, None)
     timestamp = int(parts[1])
     if timestamp < time.time() - max_age_days * 86400:
         logging.warning("Expired cookie %r", value)
-        return None
+        return (None, None)
     if timestamp > time.time() + 31 * 86400:
         # _cookie_signature does not hash a delimiter between the
         # parts of the cookie, so an attacker could transfer trailing
@@ -259,29 +579,59 @@ def decode_signed_value(secret, name, value, max_age_days=31):
         # signature.  For backwards compatibility, sanity-check timestamp
         # here instead of modifying _cookie_signature.
         logging.warning("Cookie timestamp in future; possible tampering %r", value)
-        return None
+        return (None, None)
     if parts[1].startswith(b"0"):
         logging.warning("Tampered cookie %r", value)
-        return None
+        return (None, None)
     try:
-        return base64.b64decode(parts[0])
+        return (timestamp, base64.b64decode(parts[0]))
     except Exception:
-        return None
+        return (None, None)
+
+
+_SIGNERS = {}
+
+
+def _signer(secret):
+    """
+    Returns an HMAC object keyed with ``secret``, with nothing hashed yet.
+
+    Keying derives the inner & outer pads, so do it once per secret & copy
+    the result for each signature.
+    """
+    try:
+        return _SIGNERS[secret]
+    except KeyError:
+        if len(_SIGNERS) >= 8:
+            _SIGNERS.clear()
+
+        signer = _SIGNERS[secret] = hmac.new(utf8(secret), digestmod=hashlib.sha1)
+        return signer
 
 
 def _create_signature(secret, *parts):
-    hash = hmac.new(utf8(secret), digestmod=hashlib.sha1)
+    hash = _signer(secret).copy()
     for part in parts:
         hash.update(utf8(part))
     return utf8(hash.hexdigest())
 
 
-class HTTPHeaders(dict):
+class HTTPHeaders(object):
     """A dictionary that maintains Http-Header-Case for all keys.
+
+    Every value for a header is kept in a single list per name, so adding a
+    value is just an append. Plain access (``headers['Via']``, ``.items()``,
+    ``dict(headers)``) joins them with commas on demand, while
+    ``get_list``/``get_all`` hand back the individual values.
+
+    Not a ``dict`` subclass, as Python 2's ``dict()`` would copy the lists
+    straight out of the storage.
     """
+    __slots__ = ('_values', '_last_key')
+    __hash__ = None
+
     def __init__(self, *args, **kwargs):
-        dict.__init__(self)
-        self._as_list = {}
+        self._values = {}
         self._last_key = None
         if (len(args) == 1 and len(kwargs) == 0 and
                 isinstance(args[0], HTTPHeaders)):
@@ -290,22 +640,28 @@ class HTTPHeaders(dict):
         else:
             self.update(*args, **kwargs)
 
+    @staticmethod
+    def _join(values):
+        if len(values) == 1:
+            return values[0]
+
+        return ','.join([native_str(value) for value in values])
+
     def add(self, name, value):
         """Adds a new value for the given key."""
         norm_name = HTTPHeaders._normalize_name(name)
         self._last_key = norm_name
-        if norm_name in self:
-            dict.__setitem__(self, norm_name,
-                             native_str(self[norm_name]) + ',' +
-                             native_str(value))
-            self._as_list[norm_name].append(value)
+        values = self._values.get(norm_name)
+
+        if values is None:
+            self._values[norm_name] = [value]
         else:
-            self[norm_name] = value
+            values.append(value)
 
     def get_list(self, name):
         """Returns all values for the given header as a list."""
         norm_name = HTTPHeaders._normalize_name(name)
-        return self._as_list.get(norm_name, [])
+        return list(self._values.get(norm_name, []))
 
     def get_all(self):
         """Returns an iterable of all (name, value) pairs.
@@ -313,7 +669,7 @@ class HTTPHeaders(dict):
         If a header has multiple values, multiple pairs will be
         returned with the same name.
         """
-        for name, list in self._as_list.items():
+        for name, list in self._values.iteritems():
             for value in list:
                 yield (name, value)
 
@@ -323,9 +679,7 @@ class HTTPHeaders(dict):
         if line[0].isspace():
             # continuation of a multi-line header
             new_part = ' ' + line.lstrip()
-            self._as_list[self._last_key][-1] += new_part
-            dict.__setitem__(self, self._last_key,
-                             self[self._last_key] + new_part)
+            self._values[self._last_key][-1] += new_part
         else:
             name, value = line.split(":", 1)
             self.add(name, value.strip())
@@ -341,34 +695,120 @@ class HTTPHeaders(dict):
         return h
 
     def __setitem__(self, name, value):
-        norm_name = HTTPHeaders._normalize_name(name)
-        dict.__setitem__(self, norm_name, value)
-        self._as_list[norm_name] = [value]
+        self._values[HTTPHeaders._normalize_name(name)] = [value]
 
     def __getitem__(self, name):
-        return dict.__getitem__(self, HTTPHeaders._normalize_name(name))
+        return HTTPHeaders._join(self._values[HTTPHeaders._normalize_name(name)])
 
     def __delitem__(self, name):
-        norm_name = HTTPHeaders._normalize_name(name)
-        dict.__delitem__(self, norm_name)
-        del self._as_list[norm_name]
+        del self._values[HTTPHeaders._normalize_name(name)]
 
     def __contains__(self, name):
-        norm_name = HTTPHeaders._normalize_name(name)
-        return dict.__contains__(self, norm_name)
+        return HTTPHeaders._normalize_name(name) in self._values
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
 
     def get(self, name, default=None):
-        return dict.get(self, HTTPHeaders._normalize_name(name), default)
+        values = self._values.get(HTTPHeaders._normalize_name(name))
+
+        if values is None:
+            return default
+
+        return HTTPHeaders._join(values)
+
+    def pop(self, name, *default):
+        norm_name = HTTPHeaders._normalize_name(name)
+
+        if not norm_name in self._values:
+            if default:
+                return default[0]
+
+            raise KeyError(name)
+
+        return HTTPHeaders._join(self._values.pop(norm_name))
+
+    def popitem(self):
+        name, values = self._values.popitem()
+        return (name, HTTPHeaders._join(values))
+
+    def setdefault(self, name, default=None):
+        if not name in self:
+            self[name] = default
+
+        return self[name]
+
+    def clear(self):
+        self._values.clear()
+
+    def iterkeys(self):
+        return iter(self._values)
+
+    def iteritems(self):
+        for name, values in self._values.iteritems():
+            yield (name, HTTPHeaders._join(values))
+
+    def itervalues(self):
+        for values in self._values.itervalues():
+            yield HTTPHeaders._join(values)
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
 
     def update(self, *args, **kwargs):
-        for k, v in dict(*args, **kwargs).items():
+        if len(args) > 1:
+            raise TypeError("update expected at most 1 arguments, got %d" % len(args))
+
+        if args:
+            other = args[0]
+
+            if isinstance(other, HTTPHeaders):
+                # Keep every value, replacing any the names already had.
+                for name in other:
+                    self.pop(name, None)
+
+                for name, value in other.get_all():
+                    self.add(name, value)
+            elif hasattr(other, 'items'):
+                for k, v in other.items():
+                    self[k] = v
+            else:
+                for k, v in other:
+                    self[k] = v
+
+        for k, v in kwargs.items():
             self[k] = v
 
     def copy(self):
         return HTTPHeaders(self)
 
+    def __eq__(self, other):
+        if isinstance(other, HTTPHeaders):
+            other = dict(other.iteritems())
+
+        return dict(self.iteritems()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
     _NORMALIZED_HEADER_RE = re.compile(
         r'^[A-Z0-9][a-z0-9]*(-[A-Z0-9][a-z0-9]*)*$')
+    # Clients can send any header names they like, so the cache is capped.
+    _NORMALIZED_CACHE_SIZE = 1000
     _normalized_headers = {}
 
     @staticmethod
@@ -383,271 +823,1875 @@ class HTTPHeaders(dict):
             else:
                 normalized = "-".join(
                     [w.capitalize() for w in name.split("-")])
+
+            if len(HTTPHeaders._normalized_headers) >= HTTPHeaders._NORMALIZED_CACHE_SIZE:
+                # Cheaper than tracking recency. The common names are
+                # back in after a request or two.
+                HTTPHeaders._normalized_headers.clear()
+
             HTTPHeaders._normalized_headers[name] = normalized
             return normalized
 
 
-class Request(object):
-    """An object to wrap the environ bits in a friendlier way."""
-    GET = {}
+class BodyStream(object):
+    """A read-only, file-like object over an iterable of body chunks."""
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
 
-    def __init__(self, environ, start_response):
-        self._environ = environ
-        self._start_response = start_response
-        self.setup_self()
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._buffer + b''.join(self._chunks)
+            self._buffer = b''
+            return data
 
-    def setup_self(self):
-        self.path = add_slash(self._environ.get('PATH_INFO', ''))
-        self.method = self._environ.get('REQUEST_METHOD', 'GET').upper()
-        self.query = self._environ.get('QUERY_STRING', '')
-        self.content_length = 0
-        self.headers = HTTPHeaders()
-        if self._environ.get("CONTENT_TYPE"):
-            self.headers["Content-Type"] = self._environ["CONTENT_TYPE"]
-        if self._environ.get("CONTENT_LENGTH"):
-            self.headers["Content-Length"] = self._environ["CONTENT_LENGTH"]
-        for key in self._environ:
-            if key.startswith("HTTP_"):
-                self.headers[key[5:].replace("_", "-")] = self._environ[key]
-        try:
-            self.content_length = int(self._environ.get('CONTENT_LENGTH', '0'))
-        except ValueError:
-            pass
+        while len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
 
-        self.GET = self.build_get_dict()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
 
-    def __getattr__(self, name):
-        """
-        Allow accesses of the environment if we don't already have an attribute
-        for. This lets you do things like::
+    def __iter__(self):
+        if self._buffer:
+            data, self._buffer = self._buffer, b''
+            yield data
 
-            script_name = request.SCRIPT_NAME
-        """
-        return self._environ[name]
+        for chunk in self._chunks:
+            yield chunk
 
-    @lazyproperty
-    def POST(self):
-        return self.build_complex_dict()
 
-    @lazyproperty
-    def PUT(self):
-        return self.build_complex_dict()
+class UploadedFile(object):
+    """
+    A file sent as part of a ``multipart/form-data`` body.
 
-    @lazyproperty
-    def body(self):
-        """Content of the request."""
-        return self._environ['wsgi.input'].read(self.content_length)
+    The contents live in ``file``, which is kept in memory for small uploads
+    & rolled over to a temporary file past ``MULTIPART_SPOOL_SIZE``.
+    """
+    def __init__(self, name, filename, type, headers, file, size=0):
+        self.name = name
+        self.filename = filename
+        self.type = type
+        self.headers = headers
+        self.file = file
+        self.size = size
 
     @property
-    def cookies(self):
-        """A dictionary of Cookie.Morsel objects."""
-        if not hasattr(self, "_cookies"):
-            self._cookies = Cookie.SimpleCookie()
-            if "Cookie" in self.headers:
-                try:
-                    self._cookies.load(
-                        native_str(self.headers["Cookie"]))
-                except Exception:
-                    self._cookies = None
-        return self._cookies
+    def value(self):
+        """The full contents of the file. Reads it all into memory."""
+        self.file.seek(0)
+        return self.file.read()
 
-    def get_cookie(self, name, default=None):
-        """Gets the value of the cookie with the given name, else default."""
-        if self.cookies is not None and name in self.cookies:
-            return self.cookies[name].value
-        return default
+    def __repr__(self):
+        return '<UploadedFile: %s (%s, %d bytes)>' % (self.filename, self.type, self.size)
 
-    def get_secure_cookie(self, name, value=None, max_age_days=31):
-        """Returns the given signed cookie if it validates, or None.
-        """
-        if value is None:
-            value = self.get_cookie(name)
-        return decode_signed_value(COOKIE_SECRET, name, value,
-                                   max_age_days=max_age_days)
 
-    def build_get_dict(self):
-        """Takes GET data and rips it apart into a dict."""
-        raw_query_dict = parse_qs(self.query, keep_blank_values=1)
-        query_dict = {}
+class MultipartParser(object):
+    """
+    An incremental ``multipart/form-data`` parser.
 
-        for key, value in raw_query_dict.items():
-            if len(value) <= 1:
-                query_dict[key] = value[0]
-            else:
-                # Since it's a list of multiple items, we must have seen more than
-                # one item of the same name come in. Store all of them.
-                query_dict[key] = value
+    Consumes an iterable of body chunks, so only about a chunk of the body is
+    held in memory at a time, no matter how large the upload is.
+    """
+    max_header_size = 64 * 1024
 
-        return query_dict
+    def __init__(self, chunks, boundary, spool_size=None, max_field_size=None,
+                 memory_limit=None):
+        self.chunks = iter(chunks)
+        self.delimiter = b'--' + utf8(boundary)
+        self.separator = b'\r\n' + self.delimiter
+        self.spool_size = spool_size if spool_size is not None else MULTIPART_SPOOL_SIZE
+        self.max_field_size = max_field_size if max_field_size is not None else MULTIPART_MAX_FIELD_SIZE
+        self.memory_limit = memory_limit if memory_limit is not None else MULTIPART_MEMORY_LIMIT
+        self.in_memory = 0
+        self.buffer = b''
 
-    def build_complex_dict(self):
-        """Takes POST/PUT data and rips it apart into a dict."""
-        raw_data = cgi.FieldStorage(fp=StringIO.StringIO(self.body), environ=self._environ)
-        query_dict = {}
+    def fill(self):
+        """Pulls the next chunk into the buffer. Errors if the body ran out."""
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return
 
-        for field in raw_data:
-            if isinstance(raw_data[field], list):
-                # Since it's a list of multiple items, we must have seen more than
-                # one item of the same name come in. Store all of them.
-                query_dict[field] = [fs.value for fs in raw_data[field]]
-            elif raw_data[field].filename:
-                # We've got a file.
-                query_dict[field] = raw_data[field]
-            else:
-                query_dict[field] = raw_data[field].value
+        raise BadRequest("Unexpected end of multipart data.")
 
-        return query_dict
+    def parse(self):
+        """Returns a list of ``(name, value)`` pairs, in the order sent."""
+        # Skip the preamble.
+        while True:
+            found = self.buffer.find(self.delimiter)
 
+            if found >= 0:
+                self.buffer = self.buffer[found + len(self.delimiter):]
+                break
 
-class Response(object):
+            self.buffer = self.buffer[-len(self.delimiter):]
+            self.fill()
 
-    def __init__(self, output, headers=None, status=200, content_type='text/html'):
-        self.output = output
-        self.content_type = content_type
-        self.status = status
-        self.headers = HTTPHeaders()
+        fields = []
 
-        if headers and isinstance(headers, HTTPHeaders):
-            self.headers = headers
-        if headers and isinstance(headers, list):
-            for (key, value) in headers:
+        while True:
+            while len(self.buffer) < 2:
+                self.fill()
+
+            if self.buffer.startswith(b'--'):
+                # Closing delimiter. Ignore the epilogue.
+                return fields
+
+            if not self.buffer.startswith(b'\r\n'):
+                raise BadRequest("Malformed multipart delimiter.")
+
+            self.buffer = self.buffer[2:]
+            fields.append(self.read_part(self.read_headers()))
+
+    def read_headers(self):
+        while True:
+            if self.buffer.startswith(b'\r\n'):
+                # A part with no headers.
+                self.buffer = self.buffer[2:]
+                return HTTPHeaders()
+
+            found = self.buffer.find(b'\r\n\r\n')
+
+            if found >= 0:
+                break
+
+            if len(self.buffer) > self.max_header_size:
+                raise BadRequest("Multipart headers too large.")
+
+            self.fill()
+
+        block, self.buffer = self.buffer[:found], self.buffer[found + 4:]
+        return HTTPHeaders.parse(native_str(block))
+
+    def read_part(self, headers):
+        disposition, options = cgi.parse_header(headers.get('Content-Disposition', ''))
+        name = options.get('name')
+        filename = options.get('filename')
+
+        budget = max(self.memory_limit - self.in_memory, 0)
+
+        if filename is None:
+            sink = StringIO.StringIO()
+            limit = self.max_field_size
+        else:
+            # Once the budget is used up, uploads go to disk right away. (A
+            # ``max_size`` of 0 would mean never.)
+            spool_size = max(min(self.spool_size, budget), 1)
+            sink = tempfile.SpooledTemporaryFile(max_size=spool_size)
+            limit = None
+
+        size = 0
+        keep = len(self.separator) - 1
+
+        while True:
+            found = self.buffer.find(self.separator)
+
+            if found >= 0:
+                data, self.buffer = self.buffer[:found], self.buffer[found + len(self.separator):]
+            elif len(self.buffer) > keep:
+                # Hang onto enough of the tail to spot a separator that's
+                # split across chunks.
+                data, self.buffer = self.buffer[:-keep], self.buffer[-keep:]
+            else:
+                data = b''
+
+            if data:
+                size += len(data)
+
+                if limit is not None and size > limit:
+                    raise BadRequest("Form field '%s' is too large." % name)
+
+                if filename is None and size > budget:
+                    raise RequestEntityTooLarge("Form fields are larger than %d bytes in total." % self.memory_limit)
+
+                sink.write(data)
+
+            if found >= 0:
+                break
+
+            self.fill()
+
+        if filename is None:
+            self.in_memory += size
+            return (name, sink.getvalue())
+
+        if size <= spool_size:
+            self.in_memory += size
+
+        sink.seek(0)
+        upload = UploadedFile(name, filename, headers.get('Content-Type', 'text/plain'),
+                              headers, sink, size=size)
+        return (name, upload)
+
+
+class QueryDict(dict):
+    """
+    A dictionary where each key may hold several values.
+
+    Each key holds a list of its values (for ``GET``, the very lists
+    ``parse_qs`` hands back). Plain access (``query['page']``, ``.get``,
+    ``.items``) returns the last value for a key, while ``getlist`` returns
+    all of them.
+
+    When building one, list (or tuple) values are taken as all the values
+    for a key. Anything else is a single value.
+    """
+    def __init__(self, *args, **kwargs):
+        super(QueryDict, self).__init__()
+        self._update(self.setlist, *args, **kwargs)
+
+    @classmethod
+    def fromkeys(cls, keys, value=None):
+        return cls((key, [value]) for key in keys)
+
+    def _update(self, set_value, *args, **kwargs):
+        if len(args) > 1:
+            raise TypeError("update expected at most 1 arguments, got %d" % len(args))
+
+        if args:
+            other = args[0]
+
+            if isinstance(other, QueryDict):
+                pairs = other.lists()
+            elif hasattr(other, 'keys'):
+                pairs = [(key, other[key]) for key in other.keys()]
+            else:
+                pairs = other
+
+            for key, value in pairs:
+                set_value(key, value)
+
+        for key, value in kwargs.items():
+            set_value(key, value)
+
+    def setlist(self, key, values):
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+
+        dict.__setitem__(self, key, list(values))
+
+    def update(self, *args, **kwargs):
+        """
+        Like ``dict.update``, but (as when building one) list values are
+        taken as all the values for a key.
+        """
+        self._update(self.setlist, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if not key in self:
+            self[key] = default
+
+        return self[key]
+
+    def pop(self, key, *default):
+        try:
+            values = dict.pop(self, key)
+        except KeyError:
+            if default:
+                return default[0]
+
+            raise
+
+        if not values:
+            raise KeyError(key)
+
+        return values[-1]
+
+    def popitem(self):
+        key, values = dict.popitem(self)
+        return (key, values[-1] if values else None)
+
+    def __getitem__(self, key):
+        values = dict.__getitem__(self, key)
+
+        if not values:
+            raise KeyError(key)
+
+        return values[-1]
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, [value])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def getlist(self, key, default=None):
+        """Returns every value for the key as a list."""
+        if key in self:
+            return list(dict.__getitem__(self, key))
+
+        if default is None:
+            return []
+
+        return default
+
+    def appendlist(self, key, value):
+        dict.setdefault(self, key, []).append(value)
+
+    def lists(self):
+        """Returns a list of (key, list of values) pairs."""
+        return dict.items(self)
+
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def copy(self):
+        return QueryDict((key, list(values)) for key, values in self.lists())
+
+    def __repr__(self):
+        return '<QueryDict: %s>' % dict.__repr__(self)
+
+
+class EnvironHeaders(object):
+    """
+    A read-mostly view of the request headers, straight off the WSGI environ.
+
+    Lookups translate the header name to its environ key (``User-Agent`` ->
+    ``HTTP_USER_AGENT``) instead of copying every header up front. A full
+    ``HTTPHeaders`` is only built if the headers are iterated or changed.
+    """
+    __slots__ = ('_environ', '_headers')
+    _UNPREFIXED = ('CONTENT_TYPE', 'CONTENT_LENGTH')
+
+    def __init__(self, environ):
+        self._environ = environ
+        self._headers = None
+
+    @staticmethod
+    def _environ_key(name):
+        key = name.upper().replace('-', '_')
+
+        if key in EnvironHeaders._UNPREFIXED:
+            return key
+
+        return 'HTTP_' + key
+
+    def materialize(self):
+        """Returns the backing ``HTTPHeaders``, building it if needed."""
+        if self._headers is None:
+            headers = HTTPHeaders()
+
+            for key in EnvironHeaders._UNPREFIXED:
+                if self._environ.get(key):
+                    headers[key.replace('_', '-')] = self._environ[key]
+
+            for key in self._environ:
+                if key.startswith("HTTP_"):
+                    headers[key[5:].replace("_", "-")] = self._environ[key]
+
+            self._headers = headers
+
+        return self._headers
+
+    def __getitem__(self, name):
+        if self._headers is not None:
+            return self._headers[name]
+
+        key = EnvironHeaders._environ_key(name)
+        value = self._environ.get(key)
+
+        # Empty ``CONTENT_TYPE``/``CONTENT_LENGTH`` mean "not sent".
+        if value is None or (not value and key in EnvironHeaders._UNPREFIXED):
+            raise KeyError(name)
+
+        return value
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+
+        return True
+
+    def get_list(self, name):
+        """Returns all values for the given header as a list."""
+        if self._headers is not None:
+            return self._headers.get_list(name)
+
+        if name in self:
+            return [self[name]]
+
+        return []
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __eq__(self, other):
+        if isinstance(other, EnvironHeaders):
+            other = other.materialize()
+
+        return self.materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __setitem__(self, name, value):
+        self.materialize()[name] = value
+
+    def __delitem__(self, name):
+        del self.materialize()[name]
+
+    def __getattr__(self, name):
+        # Everything else (``add``, ``items``, ``get_all``, etc.) needs the
+        # real thing.
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return getattr(self.materialize(), name)
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+
+class Request(object):
+    """
+    An object to wrap the environ bits in a friendlier way.
+
+    Uses ``__slots__`` to keep the per-request footprint down. Subclass it
+    (& set ``REQUEST_CLASS``) if you need to hang extra attributes off the
+    request.
+    """
+    __slots__ = ('_environ', '_start_response', '_lazy', '_cookies', 'path',
+                 'method', 'query', 'content_length', 'headers')
+
+    def __init__(self, environ, start_response):
+        self._environ = environ
+        self._start_response = start_response
+        self._lazy = None
+        self.setup_self()
+
+    def setup_self(self):
+        self.path = add_slash(self._environ.get('PATH_INFO', ''))
+        self.method = self._environ.get('REQUEST_METHOD', 'GET').upper()
+        self.query = self._environ.get('QUERY_STRING', '')
+        self.content_length = 0
+        self.headers = EnvironHeaders(self._environ)
+        try:
+            self.content_length = int(self._environ.get('CONTENT_LENGTH', '0'))
+        except ValueError:
+            pass
+
+    def __getattr__(self, name):
+        """
+        Allow accesses of the environment if we don't already have an attribute
+        for. This lets you do things like::
+
+            script_name = request.SCRIPT_NAME
+        """
+        if name.startswith('_'):
+            # Unset private slots, ``__dict__`` lookups & the like.
+            raise AttributeError(name)
+
+        return self._environ[name]
+
+    @lazyproperty
+    def GET(self):
+        return self.build_get_dict()
+
+    @lazyproperty
+    def POST(self):
+        return self.build_complex_dict()
+
+    @lazyproperty
+    def PUT(self):
+        return self.build_complex_dict()
+
+    @lazyproperty
+    def body(self):
+        """Content of the request."""
+        return b''.join(self.iter_body())
+
+    @lazyproperty
+    def stream(self):
+        """
+        The request body as a file-like object, read from ``wsgi.input`` as
+        you go. Like ``iter_body``, can only be consumed once.
+        """
+        return BodyStream(self.iter_body())
+
+    @lazyproperty
+    def cookie_values(self):
+        """A dictionary of cookie name -> value, from the ``Cookie`` header."""
+        return parse_cookie(self.headers.get("Cookie", ''))
+
+    @property
+    def cookies(self):
+        """
+        A dictionary of Cookie.Morsel objects.
+
+        Only built when asked for. Use ``cookie_values``/``get_cookie`` if you
+        just need the values.
+        """
+        if not hasattr(self, "_cookies"):
+            self._cookies = Cookie.SimpleCookie()
+            for name, value in self.cookie_values.items():
+                try:
+                    self._cookies[name] = value
+                except Cookie.CookieError:
+                    # Names SimpleCookie won't accept.
+                    continue
+        return self._cookies
+
+    def get_cookie(self, name, default=None):
+        """Gets the value of the cookie with the given name, else default."""
+        return self.cookie_values.get(name, default)
+
+    def check_not_modified(self, etag=None, last_modified=None, headers=None,
+                           content_type=None):
+        """
+        Raises ``NotModified`` (a 304) if the client already has the current
+        version, as described by an ``etag`` and/or ``last_modified`` time.
+
+        Call it with cheap validators before building an expensive body &
+        put the same ones on the full response via ``Response.set_etag`` and
+        ``Response.set_last_modified``. Pass the full response's ``headers``
+        (a list or ``HTTPHeaders``) & ``content_type`` too, so the 304 repeats
+        its ``Cache-Control``, ``Expires`` & ``Vary``.
+        """
+        if etag is not None:
+            etag = quote_etag(etag)
+
+        if is_not_modified(self, etag, last_modified):
+            raise NotModified(etag, last_modified, headers, content_type)
+
+    def get_secure_cookie(self, name, value=None, max_age_days=31):
+        """Returns the given signed cookie if it validates, or None.
+        """
+        if value is None:
+            value = self.get_cookie(name)
+        return decode_signed_value(COOKIE_SECRET, name, value,
+                                   max_age_days=max_age_days)
+
+    def build_get_dict(self):
+        """Takes GET data and rips it apart into a ``QueryDict``."""
+        query_dict = QueryDict()
+        # Adopt ``parse_qs``'s lists as-is, rather than copying each one.
+        dict.update(query_dict, parse_qs(self.query, keep_blank_values=1))
+        return query_dict
+
+    def iter_body(self, chunk_size=None, max_size=None):
+        """
+        Yields the request body in chunks of at most ``chunk_size`` bytes
+        (defaults to ``CHUNK_SIZE``), so large bodies can be handled in
+        constant memory. Understands ``Transfer-Encoding: chunked`` input.
+
+        Raises ``RequestEntityTooLarge`` if the body is bigger than
+        ``max_size`` (defaults to ``MAX_BODY_SIZE``). When a
+        ``Content-Length`` is sent, that happens before anything is read.
+
+        The body comes straight off the wire, so it can only be consumed once
+        (unless it has been read in full via ``body``).
+        """
+        if lazyproperty.computed(self, 'body'):
+            # Already read in full.
+            yield self.body
+            return
+
+        chunk_size = chunk_size or CHUNK_SIZE
+
+        if max_size is None:
+            max_size = MAX_BODY_SIZE
+
+        if max_size is not None and self.content_length > max_size:
+            raise RequestEntityTooLarge("Request body is larger than %d bytes." % max_size)
+
+        stream = self._environ['wsgi.input']
+
+        if self._environ.get('wsgi.input_terminated'):
+            # The server has already dealt with framing. Read until EOF.
+            chunks = iter(lambda: stream.read(chunk_size), b'')
+        elif 'chunked' in self._environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+            chunks = self._iter_chunked(stream, chunk_size)
+        else:
+            chunks = self._iter_content_length(stream, chunk_size)
+
+        seen = 0
+
+        for chunk in chunks:
+            seen += len(chunk)
+
+            if max_size is not None and seen > max_size:
+                raise RequestEntityTooLarge("Request body is larger than %d bytes." % max_size)
+
+            yield chunk
+
+    def _iter_content_length(self, stream, chunk_size):
+        remaining = self.content_length
+
+        while remaining > 0:
+            chunk = stream.read(min(chunk_size, remaining))
+
+            if not chunk:
+                break
+
+            remaining -= len(chunk)
+            yield chunk
+
+    def _iter_chunked(self, stream, chunk_size):
+        while True:
+            line = stream.readline()
+
+            try:
+                # Ignore any chunk extensions.
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise BadRequest("Invalid chunk size in request body.")
+
+            if size < 0:
+                raise BadRequest("Invalid chunk size in request body.")
+
+            if size == 0:
+                # Skip over any trailers.
+                while stream.readline().strip():
+                    pass
+
+                return
+
+            while size > 0:
+                chunk = stream.read(min(chunk_size, size))
+
+                if not chunk:
+                    raise BadRequest("Unexpected end of chunked request body.")
+
+                size -= len(chunk)
+                yield chunk
+
+            # The CRLF that closes the chunk.
+            stream.readline()
+
+    def build_complex_dict(self):
+        """Takes POST/PUT data and rips it apart into a dict."""
+        ctype, options = cgi.parse_header(self._environ.get('CONTENT_TYPE', ''))
+
+        if ctype == 'multipart/form-data' and options.get('boundary'):
+            return self.build_multipart_dict(options['boundary'])
+
+        raw_data = cgi.FieldStorage(fp=StringIO.StringIO(self.body), environ=self._environ)
+        query_dict = {}
+
+        for field in raw_data:
+            if isinstance(raw_data[field], list):
+                # Since it's a list of multiple items, we must have seen more than
+                # one item of the same name come in. Store all of them.
+                query_dict[field] = [fs.value for fs in raw_data[field]]
+            elif raw_data[field].filename:
+                # We've got a file.
+                query_dict[field] = raw_data[field]
+            else:
+                query_dict[field] = raw_data[field].value
+
+        return query_dict
+
+    def build_multipart_dict(self, boundary):
+        """
+        Streams a ``multipart/form-data`` body into a dict, without buffering
+        the whole body. Files become ``UploadedFile`` objects.
+        """
+        parser = MultipartParser(self.iter_body(), boundary)
+        query_dict = {}
+
+        for name, value in parser.parse():
+            if name in query_dict:
+                if not isinstance(query_dict[name], list):
+                    query_dict[name] = [query_dict[name]]
+
+                query_dict[name].append(value)
+            else:
+                query_dict[name] = value
+
+        return query_dict
+
+
+class FileWrapper(object):
+    """Iterates over a file-like object in blocks, closing it when done."""
+    def __init__(self, filelike, block_size=None):
+        self.filelike = filelike
+        self.block_size = block_size or CHUNK_SIZE
+
+    def __iter__(self):
+        read = self.filelike.read
+        block_size = self.block_size
+
+        while True:
+            data = read(block_size)
+
+            if not data:
+                break
+
+            yield data
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+class EncodedIterable(object):
+    """
+    Passes through the chunks of an iterable, encoding any unicode as UTF-8.
+
+    Closes the wrapped iterable when the server closes the response.
+    """
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            if isinstance(chunk, unicode_type):
+                chunk = chunk.encode('utf-8')
+
+            yield chunk
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+# Non-``text/`` content types that still carry text.
+TEXTUAL_CONTENT_TYPES = frozenset([
+    'application/javascript', 'application/json', 'application/xml',
+    'application/xhtml+xml', 'application/rss+xml', 'application/atom+xml',
+    'image/svg+xml',
+])
+
+
+def content_type_header(content_type):
+    """
+    Returns the ``Content-Type`` header for a response, adding
+    ``charset=utf-8`` to textual types that don't already have parameters.
+    """
+    if ';' in content_type:
+        return content_type
+
+    if content_type.startswith('text/') or content_type in TEXTUAL_CONTENT_TYPES \
+            or content_type.endswith(('+xml', '+json')):
+        return "%s; charset=utf-8" % content_type
+
+    return content_type
+
+
+class Response(object):
+    __slots__ = ('output', 'content_type', 'status', 'headers', 'request',
+                 'file_wrapper', '_new_cookie')
+
+    def __init__(self, output, headers=None, status=200, content_type='text/html'):
+        self.output = output
+        self.content_type = content_type
+        self.status = status
+        self.headers = HTTPHeaders()
+        # The server's ``wsgi.file_wrapper``, if any. Set by ``handle_request``.
+        self.file_wrapper = None
+
+        if headers and isinstance(headers, HTTPHeaders):
+            self.headers = headers
+        if headers and isinstance(headers, list):
+            for (key, value) in headers:
                 self.headers.add(key, value)
 
-    def add_header(self, key, value):
-        self.headers.add(key, value)
+    def add_header(self, key, value):
+        self.headers.add(key, value)
+
+    def set_cookie(self, name, value, domain=None, expires=None, path="/",
+                   expires_days=None, **kwargs):
+        """Sets the given cookie name/value with the given options.
+        """
+        name = native_str(name)
+        value = native_str(value)
+        if re.search(r"[\x00-\x20]", name + value):
+            raise ValueError("Invalid cookie %r: %r" % (name, value))
+        if not hasattr(self, "_new_cookie"):
+            self._new_cookie = Cookie.SimpleCookie()
+        if name in self._new_cookie:
+            del self._new_cookie[name]
+        self._new_cookie[name] = value
+        morsel = self._new_cookie[name]
+        if domain:
+            morsel["domain"] = domain
+        if expires_days is not None and not expires:
+            expires = datetime.datetime.utcnow() + datetime.timedelta(
+                days=expires_days)
+        if expires:
+            morsel["expires"] = format_timestamp(expires)
+        if path:
+            morsel["path"] = path
+        for k, v in kwargs.items():
+            if k == 'max_age':
+                k = 'max-age'
+            morsel[k] = v
+
+    def clear_cookie(self, name, path="/", domain=None):
+        """Deletes the cookie with the given name."""
+        expires = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+        self.set_cookie(name, value="", path=path, expires=expires,
+                        domain=domain)
+
+    def clear_all_cookies(self):
+        """Deletes all the cookies the user sent with this request."""
+        for name in self.request.cookies:
+            self.clear_cookie(name)
+
+    def set_secure_cookie(self, name, value, expires_days=30, **kwargs):
+        """Signs and timestamps a cookie so it cannot be forged."""
+        self.set_cookie(name, self.create_signed_value(name, value),
+                        expires_days=expires_days, **kwargs)
+
+    def create_signed_value(self, name, value):
+        """Signs and timestamps a string so it cannot be forged.
+        """
+        return create_signed_value(COOKIE_SECRET, name, value)
+
+    def set_etag(self, etag=None, weak=False):
+        """
+        Sets the ``ETag`` header.
+
+        If no ``etag`` is given, one is generated by hashing the output. That
+        only works for buffered output & is a no-op for streamed bodies.
+        """
+        if etag is None:
+            body = self.encoded_output()
+
+            if body is None:
+                return
+
+            etag = hashlib.sha1(body).hexdigest()
+
+        self.headers['ETag'] = quote_etag(etag, weak=weak)
+
+    def set_last_modified(self, timestamp):
+        """Sets the ``Last-Modified`` header from a timestamp or datetime."""
+        self.headers['Last-Modified'] = format_timestamp(timestamp)
+
+    def send(self, start_response):
+        status = "%d %s" % (self.status, HTTP_MAPPINGS.get(self.status))
+        headers = [(k, v) for k, v in self.headers.iteritems()]
+
+        if self.content_type is not None:
+            headers.insert(0, ('Content-Type', content_type_header(self.content_type)))
+
+        if hasattr(self, "_new_cookie"):
+            for cookie in self._new_cookie.values():
+                headers.append(("Set-Cookie", utf8(cookie.OutputString(None))))
+
+        body = self.encoded_output()
+
+        # Knowing the length up front lets the server keep the connection
+        # alive. Statuses that can't have a body mustn't send one.
+        if body is not None and not 'Content-Length' in self.headers \
+                and self.status >= 200 and not self.status in (204, 304):
+            headers.append(('Content-Length', str(len(body))))
+
+        start_response(status, headers)
+
+        if body is not None:
+            return [body]
+
+        return self.iter_output()
+
+    def encoded_output(self):
+        """
+        Returns the output as a byte string, or ``None`` if the output is a
+        file-like object or an iterable that should be streamed.
+        """
+        output = self.output
+
+        if output is None:
+            return b''
+
+        if isinstance(output, unicode_type):
+            return output.encode('utf-8')
+
+        if isinstance(output, bytes_type):
+            return output
+
+        if hasattr(output, 'read') or hasattr(output, '__iter__'):
+            return None
+
+        return utf8(unicode_type(output))
+
+    def iter_output(self):
+        """
+        Returns the output as a WSGI body iterable.
+
+        Buffered output is sent as a single chunk. File-like objects go to the
+        server's ``wsgi.file_wrapper`` when it has one (so it can use
+        ``sendfile``), otherwise they're read in ``CHUNK_SIZE`` blocks. Other
+        iterables (i.e. generators) are passed through, so large bodies can be
+        streamed lazily.
+        """
+        body = self.encoded_output()
+
+        if body is not None:
+            return [body]
+
+        if hasattr(self.output, 'read'):
+            if self.file_wrapper is not None:
+                return self.file_wrapper(self.output, CHUNK_SIZE)
+
+            return FileWrapper(self.output)
+
+        return EncodedIterable(self.output)
+
+    def convert_to_ascii(self, data):
+        if isinstance(data, unicode):
+            try:
+                return data.encode('us-ascii')
+            except UnicodeError, e:
+                raise
+        else:
+            return str(data)
+
+
+# The classes ``handle_request`` wraps requests & handler return values in.
+# Request & Response use ``__slots__``, so handlers can't hang extra
+# attributes (``request.user = ...``) off them. Point these at subclasses
+# that declare the extra slots (or leave ``__slots__`` out) if you need to.
+REQUEST_CLASS = Request
+RESPONSE_CLASS = Response
+
+
+# Compression
+
+def accepts_encoding(accept_encoding, encoding):
+    """Returns whether an ``Accept-Encoding`` header allows the given encoding."""
+    accepted = {}
+
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+
+        accepted[coding.strip().lower()] = quality
+
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
 
-    def set_cookie(self, name, value, domain=None, expires=None, path="/",
-                   expires_days=None, **kwargs):
-        """Sets the given cookie name/value with the given options.
+class CompressedIterable(object):
+    """Compresses the chunks of a body iterable as they're sent."""
+    def __init__(self, iterable, wbits, level):
+        self.iterable = iterable
+        self.wbits = wbits
+        self.level = level
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+
+        for chunk in self.iterable:
+            data = compressor.compress(chunk)
+
+            if data:
+                yield data
+
+        yield compressor.flush()
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+class Compressor(object):
+    """
+    Compresses responses with gzip or deflate, based on the request's
+    ``Accept-Encoding``.
+
+    Only responses with a content type in ``content_types`` (entries ending
+    in ``/`` match a whole family, i.e. ``text/``) are touched. Buffered
+    bodies under ``min_size`` bytes are left alone. Compressed buffered
+    bodies are kept in a bounded cache, keyed on a digest of the raw bytes,
+    so identical output (static files, say) isn't compressed again each hit.
+    """
+    # Zlib window bits for each encoding. 16+ gets a gzip header & trailer.
+    ENCODINGS = {
+        'gzip': 16 + zlib.MAX_WBITS,
+        'deflate': zlib.MAX_WBITS,
+    }
+
+    def __init__(self, min_size=1024, content_types=None, level=6, cache_size=128,
+                 max_cached_size=1024 * 1024):
+        self.min_size = min_size
+        self.content_types = tuple(content_types or (
+            'text/', 'application/json', 'application/javascript',
+            'application/xml', 'image/svg+xml',
+        ))
+        self.level = level
+        self.max_cached_size = max_cached_size
+        self.cache = LRUCache(cache_size)
+
+    def compressible(self, content_type):
+        content_type = content_type.split(';', 1)[0].strip().lower()
+
+        for allowed in self.content_types:
+            if allowed.endswith('/') and content_type.startswith(allowed):
+                return True
+
+            if content_type == allowed:
+                return True
+
+        return False
+
+    def choose_encoding(self, accept_encoding):
+        """Returns ``'gzip'``, ``'deflate'`` or ``None``, from an ``Accept-Encoding``."""
+        for encoding in ('gzip', 'deflate'):
+            if accepts_encoding(accept_encoding, encoding):
+                return encoding
+
+        return None
+
+    def deflate(self, body, encoding):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.ENCODINGS[encoding])
+        return compressor.compress(body) + compressor.flush()
+
+    def compress(self, body, encoding, asset=None):
         """
-        name = native_str(name)
-        value = native_str(value)
-        if re.search(r"[\x00-\x20]", name + value):
-            raise ValueError("Invalid cookie %r: %r" % (name, value))
-        if not hasattr(self, "_new_cookie"):
-            self._new_cookie = Cookie.SimpleCookie()
-        if name in self._new_cookie:
-            del self._new_cookie[name]
-        self._new_cookie[name] = value
-        morsel = self._new_cookie[name]
-        if domain:
-            morsel["domain"] = domain
-        if expires_days is not None and not expires:
-            expires = datetime.datetime.utcnow() + datetime.timedelta(
-                days=expires_days)
-        if expires:
-            morsel["expires"] = format_timestamp(expires)
-        if path:
-            morsel["path"] = path
-        for k, v in kwargs.items():
-            if k == 'max_age':
-                k = 'max-age'
-            morsel[k] = v
+        Returns the compressed body. Static assets keep their compressed
+        variants alongside the raw bytes, everything else goes through the
+        digest-keyed cache.
+        """
+        if asset is not None:
+            return asset.variant(encoding, lambda: self.deflate(body, encoding))
+
+        key = (encoding, hashlib.sha1(body).digest())
+        compressed = self.cache.get(key)
+
+        if compressed is None:
+            compressed = self.deflate(body, encoding)
+
+            if len(body) <= self.max_cached_size:
+                self.cache.set(key, compressed)
+
+        return compressed
+
+    def weaken_etag(self, response):
+        etag = response.headers.get('ETag')
+
+        if etag and not etag.startswith('W/'):
+            # No longer byte-for-byte the same as the uncompressed version.
+            response.headers['ETag'] = 'W/' + etag
+
+    def apply(self, request, response, asset=None):
+        """
+        Compresses the response in place, if it should be. ``asset`` is the
+        ``StaticAsset`` the output came from, if any.
+        """
+        if response.status < 200 or response.status in (204, 206):
+            return
+
+        if 'Content-Encoding' in response.headers or not self.compressible(response.content_type):
+            return
+
+        if not 'accept-encoding' in native_str(response.headers.get('Vary', '')).lower():
+            response.headers.add('Vary', 'Accept-Encoding')
+
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding', ''))
+
+        if encoding is None:
+            return
+
+        if response.status == 304:
+            # No body, but the validators should match the compressed 200's.
+            self.weaken_etag(response)
+            return
+
+        body = response.encoded_output()
+
+        if body is None and hasattr(response.output, 'read'):
+            length = response.headers.get('Content-Length')
+
+            if length is not None and int(length) <= self.max_cached_size:
+                # Small files (static media, say) are read & compressed in
+                # one go, so they can come from the cache next time.
+                body = response.output.read()
+                response.output.close()
+
+        if body is None:
+            response.output = CompressedIterable(response.iter_output(),
+                                                 self.ENCODINGS[encoding], self.level)
+        elif len(body) < self.min_size:
+            return
+        else:
+            response.output = self.compress(body, encoding, asset)
+
+        response.headers['Content-Encoding'] = encoding
+        self.weaken_etag(response)
+
+        if 'Content-Length' in response.headers:
+            # Let ``send`` work out the new one.
+            del response.headers['Content-Length']
+
+
+COMPRESSION = None
+
+ETAGS = False
+
+
+def enable_etags(enabled=True):
+    """
+    Turns on automatic ``ETag`` headers, hashed from each buffered 200
+    response's output, so clients can revalidate with ``If-None-Match``.
+    """
+    global ETAGS
+    ETAGS = enabled
+
+
+def conditional_response(request, response):
+    """
+    Returns a bodiless 304 in place of ``response`` if the client's cached
+    copy is still current, otherwise ``response`` itself.
+    """
+    if response.status != 200:
+        return response
+
+    if ETAGS and not 'ETag' in response.headers:
+        response.set_etag()
+
+    if not is_not_modified(request, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified')):
+        return response
+
+    unchanged = not_modified_response(request, response.headers, response.content_type)
+
+    if hasattr(response.output, 'close'):
+        response.output.close()
+
+    return unchanged
+
+
+# Headers a 304 repeats from the response it stands in for.
+NOT_MODIFIED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Vary')
+
+
+def not_modified_response(request, headers, content_type=None):
+    """
+    Builds a 304 standing in for a response with the given ``headers``
+    (``HTTPHeaders``) & ``content_type``.
+
+    If compression would have applied to the full response, the ``ETag`` is
+    weakened & ``Vary`` added to match.
+    """
+    unchanged = Response('', status=304, content_type=content_type)
+
+    for name in NOT_MODIFIED_HEADERS:
+        for value in headers.get_list(name):
+            unchanged.headers.add(name, value)
+
+    if COMPRESSION is not None and content_type is not None \
+            and not 'Content-Encoding' in headers:
+        COMPRESSION.apply(request, unchanged)
+
+    return unchanged
+
+
+def enable_compression(min_size=1024, content_types=None, level=6, cache_size=128):
+    """
+    Turns on gzip/deflate compression of responses, for clients that ask.
+
+    Accepts an optional ``min_size`` (integer, bytes below which buffered
+    bodies aren't worth compressing), ``content_types`` (list of types to
+    compress, ``text/`` style entries match a family), ``level`` (integer,
+    zlib compression level) & ``cache_size`` (integer, number of compressed
+    bodies to keep) parameters. Passing ``min_size=None`` turns it back off.
+    """
+    global COMPRESSION
+
+    if min_size is None:
+        COMPRESSION = None
+    else:
+        COMPRESSION = Compressor(min_size, content_types, level, cache_size)
+
+    return COMPRESSION
+
+
+class AdmissionController(object):
+    """
+    Caps the number of requests being handled at once, so a traffic spike
+    gets fast 503s rather than ever growing latency for everyone.
+
+    Requests over the cap wait up to ``wait_timeout`` seconds for a slot
+    (with at most ``max_waiting`` waiting at once), then are turned away
+    with ``ServiceUnavailable``.
+
+    Besides the global ``max_in_flight``, each route (keyed on the URL
+    pattern it was registered with) can be capped, via ``route_limits`` or
+    a default ``route_max_in_flight``.
+
+    With ``adaptive`` on, the global cap is lowered while the average
+    latency is over ``target_latency`` seconds & raised back towards
+    ``max_in_flight`` once it recovers.
+    """
+    def __init__(self, max_in_flight=100, route_max_in_flight=None,
+                 route_limits=None, max_waiting=10, wait_timeout=0.05,
+                 retry_after=1, adaptive=False, target_latency=0.5,
+                 min_in_flight=1):
+        self.max_in_flight = max_in_flight
+        self.route_max_in_flight = route_max_in_flight
+        self.route_limits = route_limits or {}
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.min_in_flight = min_in_flight
+        self.limit = max_in_flight
+        self.latency = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._routes = {}
+        self._completed = 0
+        self._cond = threading.Condition()
+
+    def has_room(self, url):
+        if self.in_flight >= self.limit:
+            return False
+
+        route_limit = self.route_limits.get(url, self.route_max_in_flight)
+        return route_limit is None or self._routes.get(url, 0) < route_limit
+
+    def admit(self, url, wait=True):
+        """
+        Takes a slot for a request to ``url``, returning a ticket to hand to
+        ``release`` once it's done.
+
+        Raises ``ServiceUnavailable`` if there's no room. Pass ``wait=False``
+        to fail immediately rather than queue for a slot.
+        """
+        with self._cond:
+            if not self.has_room(url):
+                if not wait or self.waiting >= self.max_waiting:
+                    self.reject()
+
+                deadline = time.time() + self.wait_timeout
+                self.waiting += 1
+
+                try:
+                    while not self.has_room(url):
+                        remaining = deadline - time.time()
+
+                        if remaining <= 0:
+                            self.reject()
+
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.in_flight += 1
+            self._routes[url] = self._routes.get(url, 0) + 1
+
+        return (url, time.time())
+
+    def reject(self):
+        self.rejected += 1
+        raise ServiceUnavailable("Too many requests in flight.", retry_after=self.retry_after)
+
+    def release(self, ticket):
+        """Frees the slot taken by ``admit``."""
+        url, started = ticket
+        elapsed = time.time() - started
+
+        with self._cond:
+            self.in_flight -= 1
+            count = self._routes[url] - 1
+
+            if count:
+                self._routes[url] = count
+            else:
+                del self._routes[url]
+
+            if self.adaptive:
+                self.adapt(elapsed)
+
+            self._cond.notify_all()
+
+    def adapt(self, elapsed):
+        # Exponentially weighted, so a single slow request doesn't count
+        # for much.
+        self.latency += (elapsed - self.latency) * 0.1
+        self._completed += 1
+
+        if self._completed < self.limit:
+            return
+
+        # Adjust about once per ``limit`` requests. Back off fast, recover
+        # slowly.
+        self._completed = 0
+
+        if self.latency > self.target_latency:
+            self.limit = max(self.min_in_flight, int(self.limit * 0.9))
+        elif self.limit < self.max_in_flight:
+            self.limit += 1
+
+
+ADMISSION = None
+
+
+def enable_admission_control(max_in_flight=100, **kwargs):
+    """
+    Turns on load shedding. Requests beyond ``max_in_flight`` (integer) at
+    once are answered with a 503 & ``Retry-After``.
+
+    Accepts the rest of ``AdmissionController``'s options as keyword
+    arguments. Passing ``max_in_flight=None`` turns it back off.
+    """
+    global ADMISSION
+
+    if max_in_flight is None:
+        ADMISSION = None
+    else:
+        ADMISSION = AdmissionController(max_in_flight, **kwargs)
+
+    return ADMISSION
+
+
+def handle_request(environ, start_response):
+    """The main handler. Dispatches to the user's code."""
+    try:
+        request = REQUEST_CLASS(environ, start_response)
+    except Exception, e:
+        return handle_error(e)
+
+    try:
+        found = match_url(request)
+    except Exception, e:
+        return head_body(request, handle_error(e, request))
+
+    return dispatch_request(request, found)
+
+
+def dispatch_request(request, found):
+    """
+    Runs the handler ``match_url`` found for the request (``None`` for a
+    404) & turns the outcome into a WSGI body.
+    """
+    callback = None
+    admission = ADMISSION
+    ticket = None
+
+    try:
+        try:
+            if found is None:
+                # Unmatched paths are common (scanners, typos). Skip the
+                # exception machinery & go straight to the 404 handler.
+                return head_body(request, ERROR_HANDLERS.get(404, not_found)(request, NOT_FOUND))
+
+            (re_url, url, callback), kwargs = found
+
+            if admission is not None:
+                ticket = admission.admit(url)
+
+            if is_coroutine_handler(callback):
+                response = run_coroutine(callback(request, **kwargs))
+            else:
+                response = callback(request, **kwargs)
+        except Exception, e:
+            return head_body(request, handle_error(e, request, callback))
+
+        return finish_response(request, response)
+    finally:
+        if ticket is not None:
+            admission.release(ticket)
+
+
+def finish_response(request, response):
+    """
+    Turns what a handler returned into a WSGI body, applying conditional
+    GETs & compression along the way.
+    """
+    if not isinstance(response, Response):
+        response = RESPONSE_CLASS(response)
+
+    response.file_wrapper = request._environ.get('wsgi.file_wrapper')
+    response = conditional_response(request, response)
+
+    if COMPRESSION is not None:
+        COMPRESSION.apply(request, response)
+
+    return head_body(request, response.send(request._start_response))
+
+
+def is_coroutine_handler(callback):
+    """
+    Checks if the handler is a coroutine function (one decorated with
+    ``trollius.coroutine``/``asyncio.coroutine``).
+
+    Plain generator functions aren't coroutines here, since those are how
+    handlers stream their output.
+    """
+    return getattr(callback, '_is_coroutine', False) is True
+
+
+_COROUTINE_LOOPS = threading.local()
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine handler to completion on an event loop private to the
+    current thread.
+
+    This is how coroutine handlers work under the threaded servers. The
+    ``asyncio`` server awaits them on its own loop instead.
+    """
+    import trollius as asyncio
+
+    loop = getattr(_COROUTINE_LOOPS, 'loop', None)
+
+    if loop is None:
+        loop = _COROUTINE_LOOPS.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+    return loop.run_until_complete(coroutine)
+
+
+def head_body(request, body):
+    """
+    Drops the body of the response to a HEAD request, closing it unread.
+
+    Handlers that want to skip building an expensive body can check for
+    ``request.method == 'HEAD'`` & return an empty ``Response`` with their
+    own ``Content-Length`` header.
+    """
+    if request.method != 'HEAD':
+        return body
+
+    if hasattr(body, 'close'):
+        body.close()
+
+    return []
+
+
+class TracebackLimiter(object):
+    """
+    Rate limits traceback logging, so a failing dependency doesn't turn
+    every request into an expensive traceback format & write.
+
+    The first error for each key (exception type & handler) in a ``window``
+    of seconds is logged in full. Repeats are only counted, and the count is
+    reported with the next one logged.
+    """
+    max_keys = 1000
+
+    def __init__(self, window=10):
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """
+        Returns ``None`` if the error shouldn't be logged, else the number of
+        repeats that weren't.
+        """
+        now = time.time()
+
+        with self._lock:
+            seen = self._seen.get(key)
+
+            if seen is not None and now - seen[0] < self.window:
+                seen[1] += 1
+                return None
+
+            if len(self._seen) >= self.max_keys:
+                self._seen.clear()
+
+            self._seen[key] = [now, 0]
+            return seen[1] if seen is not None else 0
+
+
+# Set to ``None`` to log every traceback.
+TRACEBACK_LIMITER = TracebackLimiter()
+
+# Handed to the 404 handler for paths that match no route.
+NOT_FOUND = NotFound("Sorry, nothing here.")
+
+
+def log_traceback(exception, request, handler=None):
+    """Writes the current exception's traceback to ``wsgi.errors``, rate limited."""
+    suppressed = 0
+
+    if TRACEBACK_LIMITER is not None:
+        suppressed = TRACEBACK_LIMITER.check((exception.__class__, handler))
+
+        if suppressed is None:
+            return
+
+    (e_type, e_value, e_tb) = sys.exc_info()
+    message = "%s occurred on '%s': %s\nTraceback: %s" % (
+        exception.__class__,
+        request._environ['PATH_INFO'],
+        exception,
+        ''.join(traceback.format_exception(e_type, e_value, e_tb))
+    )
+
+    if suppressed:
+        message += "(%d more like this in the previous %s seconds were not logged.)\n" % (
+            suppressed, TRACEBACK_LIMITER.window)
+
+    request._environ['wsgi.errors'].write(message)
+
+
+def handle_error(exception, request=None, handler=None):
+    """If an exception is thrown, deal with it and present an error page."""
+    if request is None:
+        request = {'_environ': {'PATH_INFO': ''}}
+
+    if not getattr(exception, 'hide_traceback', False):
+        log_traceback(exception, request, handler)
+
+    if isinstance(exception, RequestError):
+        status = getattr(exception, 'status', 404)
+    else:
+        status = 500
+
+    if status in ERROR_HANDLERS:
+        return ERROR_HANDLERS[status](request, exception)
+
+    return not_found(request, exception)
+
+
+# Routing
+
+# Converters usable in route strings as ``<converter:name>``. Each maps to the
+# regex fragment that matches it & the callable that converts the captured
+# string (``None`` leaves it as a string).
+PATH_CONVERTERS = {
+    'str': (r'[^/]+', None),
+    'int': (r'\d+', int),
+    'float': (r'\d+\.\d+', float),
+    'path': (r'.+', None),
+    'uuid': (r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+             r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}', uuid.UUID),
+}
+
+_CONVERTER_RE = re.compile(
+    r'(?<!\(\?P)<(?P<converter>[a-z]+):(?P<name>[A-Za-z_]\w*)>')
+
+
+def compile_url(url):
+    """
+    Compiles a route string into the regex used to match request paths.
+
+    Besides plain regex, ``<converter:name>`` segments (i.e. ``<int:id>``) are
+    expanded to a named group, using the fragment from ``PATH_CONVERTERS``.
+    """
+    def expand(match):
+        converter = match.group('converter')
+
+        if not converter in PATH_CONVERTERS:
+            raise RuntimeError("Unknown path converter '%s' in '%s'." % (converter, url))
+
+        return '(?P<%s>%s)' % (match.group('name'), PATH_CONVERTERS[converter][0])
+
+    return re.compile("^%s$" % _CONVERTER_RE.sub(expand, add_slash(url)))
+
+
+def url_converters(url):
+    """Returns a dict of parameter name -> conversion callable for a route string."""
+    converters = {}
+
+    for match in _CONVERTER_RE.finditer(url):
+        convert = PATH_CONVERTERS.get(match.group('converter'), (None, None))[1]
+
+        if convert is not None:
+            converters[match.group('name')] = convert
+
+    return converters
+
+
+_REGEX_METACHARS = frozenset('.^$*+?{}[]\\|()')
+_REGEX_QUANTIFIERS = frozenset('*+?{')
+
+
+class RouteDispatcher(object):
+    """
+    An index over the routes registered for a single HTTP method.
+
+    Routes are sorted into three buckets when the dispatcher is built:
+
+    * purely literal paths go into a dict, for a single lookup,
+    * routes with a literal leading path (i.e. ``/users/(?P<id>\d+)/``) are
+      hung off a trie of path segments,
+    * everything else is a regex fallback.
 
-    def clear_cookie(self, name, path="/", domain=None):
-        """Deletes the cookie with the given name."""
-        expires = datetime.datetime.utcnow() - datetime.timedelta(days=365)
-        self.set_cookie(name, value="", path=path, expires=expires,
-                        domain=domain)
+    Matching only runs the regexes of the candidates the path could possibly
+    hit, in registration order, so the first match still wins.
+    """
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self.literals = {}
+        self.trie = {}
+        self.fallbacks = []
+        self.converters = []
 
-    def clear_all_cookies(self):
-        """Deletes all the cookies the user sent with this request."""
-        for name in self.request.cookies:
-            self.clear_cookie(name)
+        for index, url_set in enumerate(self.routes):
+            self.converters.append(url_converters(url_set[1]))
+            self.add(index, url_set[0])
 
-    def set_secure_cookie(self, name, value, expires_days=30, **kwargs):
-        """Signs and timestamps a cookie so it cannot be forged."""
-        self.set_cookie(name, self.create_signed_value(name, value),
-                        expires_days=expires_days, **kwargs)
+    def add(self, index, re_url):
+        pattern = re_url.pattern
 
-    def create_signed_value(self, name, value):
-        """Signs and timestamps a string so it cannot be forged.
+        if not pattern.startswith('^') or not pattern.endswith('$') \
+                or '|' in pattern or re_url.flags & (re.I | re.X):
+            # Alternation & case-folding can't be indexed safely.
+            self.fallbacks.append(index)
+            return
+
+        body = pattern[1:-1]
+        meta_at = None
+
+        for offset, char in enumerate(body):
+            if char in _REGEX_METACHARS:
+                meta_at = offset
+                break
+
+        if meta_at is None:
+            self.literals.setdefault(body, index)
+            return
+
+        if body[meta_at] in _REGEX_QUANTIFIERS:
+            # The quantifier applies to the character before it.
+            meta_at -= 1
+
+        prefix = body[:max(meta_at, 0)]
+        prefix = prefix[:prefix.rfind('/') + 1]
+        segments = prefix.strip('/').split('/') if prefix.strip('/') else []
+
+        if not prefix.startswith('/') or not segments:
+            self.fallbacks.append(index)
+            return
+
+        node = self.trie
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node.setdefault(None, []).append(index)
+
+    def candidates(self, path):
+        """Returns the indexes of the routes that might match, in order."""
+        found = list(self.fallbacks)
+        node = self.trie
+
+        for segment in path.strip('/').split('/'):
+            node = node.get(segment)
+
+            if node is None:
+                break
+
+            found.extend(node.get(None, ()))
+
+        found.sort()
+        return found
+
+    def match(self, path):
         """
-        return create_signed_value(COOKIE_SECRET, name, value)
+        Returns a ``(url_set, kwargs)`` tuple for the first matching route,
+        or ``None``.
+        """
+        literal = self.literals.get(path)
 
-    def send(self, start_response):
-        status = "%d %s" % (self.status, HTTP_MAPPINGS.get(self.status))
-        headers = ([('Content-Type', "%s; charset=utf-8" % self.content_type)] +
-                  [(k, v) for k, v in self.headers.iteritems()])
+        for index in self.candidates(path):
+            if literal is not None and index > literal:
+                break
 
-        if hasattr(self, "_new_cookie"):
-            for cookie in self._new_cookie.values():
-                headers.append(("Set-Cookie", utf8(cookie.OutputString(None))))
+            url_set = self.routes[index]
+            match = url_set[0].search(path)
 
-        start_response(status, headers)
+            if match is None:
+                continue
 
-        if isinstance(self.output, unicode):
-            return self.output.encode('utf-8')
-        else:
-            return self.output
+            kwargs = match.groupdict()
 
-    def convert_to_ascii(self, data):
-        if isinstance(data, unicode):
             try:
-                return data.encode('us-ascii')
-            except UnicodeError, e:
-                raise
-        else:
-            return str(data)
+                for name, convert in self.converters[index].items():
+                    kwargs[name] = convert(kwargs[name])
+            except ValueError:
+                # Right shape, wrong value. Treat it as not matching.
+                continue
 
+            return (url_set, kwargs)
 
-def handle_request(environ, start_response):
-    """The main handler. Dispatches to the user's code."""
-    try:
-        request = Request(environ, start_response)
-    except Exception, e:
-        return handle_error(e)
+        if literal is not None:
+            return (self.routes[literal], {})
 
-    try:
-        (re_url, url, callback), kwargs = find_matching_url(request)
-        response = callback(request, **kwargs)
-    except Exception, e:
-        return handle_error(e, request)
+        return None
 
-    if not isinstance(response, Response):
-        response = Response(response)
 
-    return response.send(start_response)
+# Maps each HTTP method to the routes list, version & length its
+# dispatcher was built from, and the dispatcher.
+_DISPATCHERS = {}
 
+# Bumped whenever routes are registered.
+ROUTES_VERSION = 0
 
-def handle_error(exception, request=None):
-    """If an exception is thrown, deal with it and present an error page."""
-    if request is None:
-        request = {'_environ': {'PATH_INFO': ''}}
 
-    if not getattr(exception, 'hide_traceback', False):
-        (e_type, e_value, e_tb) = sys.exc_info()
-        message = "%s occurred on '%s': %s\nTraceback: %s" % (
-            exception.__class__,
-            request._environ['PATH_INFO'],
-            exception,
-            ''.join(traceback.format_exception(e_type, e_value, e_tb))
-        )
-        request._environ['wsgi.errors'].write(message)
+def routes_changed():
+    """
+    Marks the compiled routes as stale. The decorators call this. Code that
+    edits ``REQUEST_MAPPINGS`` in place should too.
+    """
+    global ROUTES_VERSION
+    ROUTES_VERSION += 1
 
-    if isinstance(exception, RequestError):
-        status = getattr(exception, 'status', 404)
-    else:
-        status = 500
 
-    if status in ERROR_HANDLERS:
-        return ERROR_HANDLERS[status](request, exception)
+def compile_routes(method):
+    """
+    Returns the ``RouteDispatcher`` for the given HTTP method, (re)building it
+    if routes have been registered since it was last built.
+    """
+    routes = REQUEST_MAPPINGS[method]
+    built = _DISPATCHERS.get(method)
 
-    return not_found(request, exception)
+    if built is None or built[0] is not routes or built[1] != ROUTES_VERSION \
+            or built[2] != len(routes):
+        dispatcher = RouteDispatcher(routes)
+        _DISPATCHERS[method] = (routes, ROUTES_VERSION, len(routes), dispatcher)
+
+        if ROUTE_CACHE is not None:
+            ROUTE_CACHE.clear()
+
+        return dispatcher
+
+    return built[3]
+
+
+class RouteCache(object):
+    """
+    Caches ``(method, path)`` -> ``(url_set, kwargs)`` lookups.
+
+    Paths that matched nothing are kept in a separate, smaller cache, so a
+    flood of 404s can't push the useful entries out.
+    """
+    def __init__(self, maxsize=1024, negative_maxsize=128):
+        self.found = LRUCache(maxsize)
+        self.not_found = LRUCache(negative_maxsize)
+
+    @property
+    def hits(self):
+        return self.found.hits + self.not_found.hits
+
+    @property
+    def misses(self):
+        # Every lookup that misses checks both caches, so only count once.
+        return self.not_found.misses
+
+    def get(self, key):
+        """
+        Returns the cached match, ``False`` for a known miss or ``None`` if the
+        path hasn't been seen.
+        """
+        found = self.found.get(key)
+
+        if found is not None:
+            return found
+
+        if self.not_found.get(key) is not None:
+            return False
+
+        return None
+
+    def set(self, key, found):
+        if found is None:
+            self.not_found.set(key, True)
+        else:
+            self.found.set(key, found)
+
+    def clear(self):
+        self.found.clear()
+        self.not_found.clear()
+
+
+ROUTE_CACHE = None
+
+
+def enable_route_cache(maxsize=1024, negative_maxsize=128):
+    """
+    Turns on caching of route lookups.
+
+    Accepts an optional ``maxsize`` (integer, number of matched paths to keep)
+    and ``negative_maxsize`` (integer, number of 404 paths to keep) parameters.
+    Passing ``maxsize=None`` turns the cache back off.
+    """
+    global ROUTE_CACHE
+
+    if maxsize is None:
+        ROUTE_CACHE = None
+    else:
+        ROUTE_CACHE = RouteCache(maxsize, negative_maxsize)
+
+    return ROUTE_CACHE
 
 
 def find_matching_url(request):
     """Searches through the methods who've registed themselves with the HTTP decorators."""
+    found = match_url(request)
+
+    if found is not None:
+        return found
+
+    raise NotFound("Sorry, nothing here.")
+
+
+def match_url(request):
+    """
+    Like ``find_matching_url``, but returns ``None`` rather than raising
+    when no route matches.
+    """
     if not request.method in REQUEST_MAPPINGS:
         raise NotFound("The HTTP request method '%s' is not supported." % request.method)
 
-    for url_set in REQUEST_MAPPINGS[request.method]:
-        match = url_set[0].search(request.path)
+    dispatchers = [compile_routes(request.method)]
 
-        if match is not None:
-            return (url_set, match.groupdict())
+    if request.method == 'HEAD':
+        # Anything that answers GET answers HEAD too.
+        dispatchers.append(compile_routes('GET'))
 
-    raise NotFound("Sorry, nothing here.")
+    cache = ROUTE_CACHE
+    key = (request.method, request.path)
+    found = None
+
+    if cache is not None:
+        found = cache.get(key)
+
+    if found is None:
+        for dispatcher in dispatchers:
+            found = dispatcher.match(request.path)
+
+            if found is not None:
+                break
+
+        if cache is not None:
+            cache.set(key, found)
+    elif found is False:
+        found = None
+
+    return found
 
 
 def add_slash(url):
@@ -672,10 +2716,11 @@ def content_type(filename):
     return ct
 
 
-def static_file(filename, root=MEDIA_ROOT):
+def static_path(filename, root=MEDIA_ROOT):
     """
-    Fetches a static file from the filesystem, relative to either the given
-    MEDIA_ROOT or from the provided root directory.
+    Resolves the filesystem path of a static file, relative to either the
+    given MEDIA_ROOT or from the provided root directory, checking it exists
+    & can be read.
     """
     if filename is None:
         raise Forbidden("You must specify a file you'd like to access.")
@@ -694,7 +2739,406 @@ def static_file(filename, root=MEDIA_ROOT):
     if not os.access(desired_path, os.R_OK):
         raise Forbidden("You do not have permission to access this file.")
 
-    ct = str(content_type(desired_path))
+    return desired_path
+
+
+class StaticFileInfo(object):
+    """What we know about a static file: where it is, its size, mtime & type."""
+    __slots__ = ('path', 'size', 'mtime', 'content_type', 'etag',
+                 'last_modified', 'checked', 'gzipped')
+
+    def __init__(self, path, stat, checked=None, content_type_=None):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.content_type = content_type_ or str(content_type(path))
+        self.etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+        self.last_modified = format_timestamp(stat.st_mtime)
+        self.checked = checked or time.time()
+        # A precompressed ``.gz`` sibling, as its own ``StaticFileInfo``.
+        self.gzipped = None
+
+    def changed(self, stat):
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+    def find_gzipped(self):
+        """Looks for a ``<file>.gz`` sibling at least as fresh as the file."""
+        try:
+            stat = os.stat(self.path + '.gz')
+        except OSError:
+            self.gzipped = None
+            return
+
+        if stat.st_mtime < self.mtime:
+            self.gzipped = None
+        elif self.gzipped is None or self.gzipped.changed(stat):
+            self.gzipped = StaticFileInfo(self.path + '.gz', stat, self.checked,
+                                          self.content_type)
+
+
+class StaticFileCache(LRUCache):
+    """
+    Caches ``StaticFileInfo`` by ``(root, filename)``, so hits skip the path
+    sanitisation, existence & permission checks and the mimetype guess.
+
+    Entries are revalidated with a single ``os.stat`` once they're more than
+    ``interval`` seconds old.
+    """
+    def __init__(self, maxsize=1024, interval=1.0):
+        super(StaticFileCache, self).__init__(maxsize)
+        self.interval = interval
+
+
+STATIC_CACHE = None
+
+
+def enable_static_cache(maxsize=1024, interval=1.0):
+    """
+    Turns on caching of static file metadata.
+
+    Accepts an optional ``maxsize`` (integer, number of files to keep) and
+    ``interval`` (float, seconds between ``os.stat`` checks for changes)
+    parameters. Passing ``maxsize=None`` turns the cache back off.
+    """
+    global STATIC_CACHE
+
+    if maxsize is None:
+        STATIC_CACHE = None
+    else:
+        STATIC_CACHE = StaticFileCache(maxsize, interval)
+
+    return STATIC_CACHE
+
+
+def static_info(filename, root=MEDIA_ROOT):
+    """
+    Returns the ``StaticFileInfo`` for a static file, from ``STATIC_CACHE``
+    when it's enabled & the entry is still fresh.
+    """
+    cache = STATIC_CACHE
+    key = (root, filename)
+    now = time.time()
+
+    if cache is not None:
+        info = cache.get(key)
+
+        if info is not None:
+            if now - info.checked < cache.interval:
+                return info
+
+            try:
+                stat = os.stat(info.path)
+            except OSError:
+                cache.pop(key)
+                raise NotFound("File does not exist.")
+
+            if not info.changed(stat):
+                info.checked = now
+                info.find_gzipped()
+                return info
+
+            info = StaticFileInfo(info.path, stat, now)
+            info.find_gzipped()
+            cache.set(key, info)
+            return info
+
+    desired_path = static_path(filename, root)
+    info = StaticFileInfo(desired_path, os.stat(desired_path), now)
+    info.find_gzipped()
+
+    if cache is not None:
+        cache.set(key, info)
+
+    return info
+
+
+def parse_range_header(header, size):
+    """
+    Parses a ``Range`` header into a sorted list of ``(start, end)`` byte
+    offsets (``end`` inclusive) into a file of ``size`` bytes. Overlapping &
+    adjacent ranges are merged.
+
+    Returns ``None`` if the header is missing or malformed (so the whole file
+    should be sent) or an empty list if no range can be satisfied.
+    """
+    if not header:
+        return None
+
+    unit, _, spec = header.partition('=')
+
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+
+    for part in spec.split(','):
+        part = part.strip()
+
+        if not part:
+            continue
+
+        first, sep, last = part.partition('-')
+
+        if not sep:
+            return None
+
+        try:
+            if not first.strip():
+                # A suffix, i.e. the last N bytes.
+                length = int(last)
+
+                if length <= 0:
+                    continue
+
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = size - 1
+
+                if last.strip():
+                    end = int(last)
+
+                    if end < start:
+                        return None
+
+                    end = min(end, size - 1)
+        except ValueError:
+            return None
+
+        if start < size:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+class FileRangeIterable(object):
+    """
+    Sends just the given byte ranges of a file, seeking straight to each.
+
+    With more than one range, each is wrapped up as a part of a
+    ``multipart/byteranges`` body.
+    """
+    def __init__(self, fileobj, ranges, size, content_type=None, boundary=None):
+        self.fileobj = fileobj
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.boundary = boundary
+
+    def part_header(self, start, end):
+        return ('\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+            self.boundary, self.content_type, start, end, self.size)).encode('ascii')
+
+    def closing(self):
+        return ('\r\n--%s--\r\n' % self.boundary).encode('ascii')
+
+    def __len__(self):
+        length = sum([end - start + 1 for start, end in self.ranges])
+
+        if self.boundary is not None:
+            length += sum([len(self.part_header(start, end)) for start, end in self.ranges])
+            length += len(self.closing())
+
+        return length
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            if self.boundary is not None:
+                yield self.part_header(start, end)
+
+            self.fileobj.seek(start)
+            remaining = end - start + 1
+
+            while remaining > 0:
+                data = self.fileobj.read(min(CHUNK_SIZE, remaining))
+
+                if not data:
+                    break
+
+                remaining -= len(data)
+                yield data
+
+        if self.boundary is not None:
+            yield self.closing()
+
+    def close(self):
+        self.fileobj.close()
+
+
+def if_range_matches(request, info):
+    """
+    Returns whether a ``Range`` should be honoured, going by ``If-Range``.
+    Only strong validators count.
+    """
+    if_range = request.headers.get('If-Range')
+
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == info.etag
+
+    return parse_http_date(if_range) == int(info.mtime)
+
+
+class StaticAsset(object):
+    """The contents of a static file, plus any compressed variants of it."""
+    __slots__ = ('cache', 'path', 'size', 'mtime', 'body', 'variants')
+
+    def __init__(self, cache, info, body):
+        self.cache = cache
+        self.path = info.path
+        self.size = info.size
+        self.mtime = info.mtime
+        self.body = body
+        self.variants = {}
+
+    def weight(self):
+        return len(self.body) + sum([len(data) for data in self.variants.values()])
+
+    def variant(self, encoding, create):
+        """Returns the body in the given encoding, calling ``create`` if needed."""
+        try:
+            return self.variants[encoding]
+        except KeyError:
+            data = self.variants[encoding] = create()
+            self.cache.grew(self, len(data))
+            return data
+
+
+class StaticAssetCache(object):
+    """
+    Keeps the contents of small, hot static files in memory, within a total
+    budget of ``max_bytes``. Evicts the least recently used files first.
+
+    Entries are checked against the file's current size & mtime (as given by
+    ``static_info``), so edited files are read again.
+    """
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def fetch(self, info):
+        """
+        Returns the ``StaticAsset`` for a ``StaticFileInfo``, reading the file
+        on a miss. Returns ``None`` for files too big to cache.
+        """
+        if info.size > self.max_file_size:
+            return None
+
+        with self._lock:
+            asset = self._data.pop(info.path, None)
+
+            if asset is not None and (asset.mtime, asset.size) == (info.mtime, info.size):
+                self._data[info.path] = asset
+                self.hits += 1
+                return asset
+
+            if asset is not None:
+                self.bytes -= asset.weight()
+
+            self.misses += 1
+
+        source = open(info.path, 'rb')
+
+        try:
+            asset = StaticAsset(self, info, source.read())
+        finally:
+            source.close()
+
+        with self._lock:
+            previous = self._data.pop(info.path, None)
+
+            if previous is not None:
+                self.bytes -= previous.weight()
+
+            self._data[info.path] = asset
+            self.bytes += asset.weight()
+            self._evict()
+
+        return asset
+
+    def grew(self, asset, size):
+        """Accounts for a variant being added to an asset."""
+        with self._lock:
+            if self._data.get(asset.path) is asset:
+                self.bytes += size
+                self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._data:
+            path, asset = self._data.popitem(last=False)
+            self.bytes -= asset.weight()
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+
+STATIC_ASSET_CACHE = None
+
+
+def enable_static_asset_cache(max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024):
+    """
+    Turns on the in-memory cache of static file contents.
+
+    Accepts an optional ``max_bytes`` (integer, total size of the cached
+    files & their compressed variants) and ``max_file_size`` (integer, bytes
+    above which a file is always read from disk) parameters. Pairs well with
+    ``enable_static_cache``, which avoids the ``os.stat`` per request.
+    Passing ``max_bytes=None`` turns the cache back off.
+    """
+    global STATIC_ASSET_CACHE
+
+    if max_bytes is None:
+        STATIC_ASSET_CACHE = None
+    else:
+        STATIC_ASSET_CACHE = StaticAssetCache(max_bytes, max_file_size)
+
+    return STATIC_ASSET_CACHE
+
+
+def static_file(filename, root=MEDIA_ROOT):
+    """
+    Fetches a static file from the filesystem, relative to either the given
+    MEDIA_ROOT or from the provided root directory.
+    """
+    info = static_info(filename, root)
+    desired_path = info.path
+    ct = info.content_type
+
+    if STATIC_ASSET_CACHE is not None:
+        asset = STATIC_ASSET_CACHE.fetch(info)
+
+        if asset is not None:
+            return asset.body
 
     # Do the text types as a non-binary read.
     if ct.startswith('text') or ct.endswith('xml') or ct.endswith('json'):
@@ -712,15 +3156,137 @@ def serve_static_file(request, filename, root=MEDIA_ROOT, force_content_type=Non
 
     Accepts an optional ``root`` (filepath string, defaults to ``MEDIA_ROOT``) parameter.
     Accepts an optional ``force_content_type`` (string, guesses if ``None``) parameter.
+
+    Sends ``ETag``/``Last-Modified`` headers based on the file's size & mtime,
+    answering with a 304 (without reading the file) when the client's copy is
+    current.
+
+    The file is handed to the server as an open file rather than read into
+    memory, so servers with a ``wsgi.file_wrapper`` can ``sendfile`` it.
+
+    ``Range`` requests (honouring ``If-Range``) get a 206 with just the bytes
+    asked for, as ``multipart/byteranges`` if there's more than one range.
+
+    If there's a ``<filename>.gz`` next to the file (see
+    ``precompress_static``) that's at least as new, clients accepting gzip
+    are sent that instead, with ``Content-Encoding: gzip``.
     """
-    file_contents = static_file(filename, root)
+    info = static_info(filename, root)
 
     if force_content_type is None:
-        ct = content_type(filename)
+        ct = info.content_type
     else:
         ct = force_content_type
 
-    return Response(file_contents, content_type=ct)
+    headers = [('Accept-Ranges', 'bytes')]
+    ranges = None
+
+    if request.method in ('GET', 'HEAD') and if_range_matches(request, info):
+        ranges = parse_range_header(request.headers.get('Range'), info.size)
+
+    if ranges is not None and len(ranges) > MAX_BYTE_RANGES:
+        ranges = None
+
+    if info.gzipped is not None:
+        headers.append(('Vary', 'Accept-Encoding'))
+
+        # Ranges are served from the original, keeping the offsets simple.
+        if ranges is None and accepts_encoding(request.headers.get('Accept-Encoding', ''), 'gzip'):
+            info = info.gzipped
+            headers.append(('Content-Encoding', 'gzip'))
+
+    headers.extend([
+        ('ETag', info.etag),
+        ('Last-Modified', info.last_modified),
+    ])
+
+    if is_not_modified(request, info.etag, info.mtime):
+        raise NotModified(info.etag, info.mtime, headers, ct)
+
+    if ranges is None:
+        asset = None
+
+        if STATIC_ASSET_CACHE is not None:
+            asset = STATIC_ASSET_CACHE.fetch(info)
+
+        if asset is None:
+            response = Response(open(info.path, 'rb'), headers=headers, content_type=ct)
+            response.headers['Content-Length'] = str(info.size)
+            return response
+
+        response = Response(asset.body, headers=headers, content_type=ct)
+
+        if COMPRESSION is not None:
+            # Done here rather than in ``handle_request`` so the compressed
+            # copy is kept with the asset.
+            COMPRESSION.apply(request, response, asset)
+
+        return response
+
+    if not ranges:
+        headers.append(('Content-Range', 'bytes */%d' % info.size))
+        return Response('', headers=headers, status=416, content_type='text/plain')
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        body = FileRangeIterable(open(info.path, 'rb'), ranges, info.size)
+        headers.append(('Content-Range', 'bytes %d-%d/%d' % (start, end, info.size)))
+    else:
+        boundary = uuid.uuid4().hex
+        body = FileRangeIterable(open(info.path, 'rb'), ranges, info.size, ct, boundary)
+        ct = 'multipart/byteranges; boundary=%s' % boundary
+
+    headers.append(('Content-Length', str(len(body))))
+    return Response(body, headers=headers, status=206, content_type=ct)
+
+
+def precompress_static(root=MEDIA_ROOT, content_types=None, min_size=256, level=9):
+    """
+    Writes a gzipped ``<file>.gz`` copy next to each compressible file under
+    ``root``, for ``serve_static_file`` to send as-is. Run it before deploy.
+
+    Accepts an optional ``content_types`` (list of types to compress, as for
+    ``enable_compression``), ``min_size`` (integer, bytes below which files
+    are skipped) & ``level`` (integer, gzip compression level) parameters.
+    Copies that are already up to date are left alone. Returns the paths of
+    the files written.
+    """
+    compressor = Compressor(content_types=content_types)
+    written = []
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+
+            if filename.endswith('.gz') or not compressor.compressible(content_type(path)):
+                continue
+
+            stat = os.stat(path)
+
+            if stat.st_size < min_size:
+                continue
+
+            try:
+                if os.stat(path + '.gz').st_mtime >= stat.st_mtime:
+                    continue
+            except OSError:
+                pass
+
+            temp_path = path + '.gz.tmp'
+            source = open(path, 'rb')
+            target = gzip.GzipFile(temp_path, 'wb', level)
+
+            try:
+                for chunk in FileWrapper(source):
+                    target.write(chunk)
+            finally:
+                source.close()
+                target.close()
+
+            os.rename(temp_path, path + '.gz')
+            written.append(path + '.gz')
+
+    return written
 
 
 # Decorators
@@ -729,8 +3295,9 @@ def get(url):
     """Registers a method as capable of processing GET requests."""
     def wrapped(method):
         # Register.
-        re_url = re.compile("^%s$" % add_slash(url))
+        re_url = compile_url(url)
         REQUEST_MAPPINGS['GET'].append((re_url, url, method))
+        routes_changed()
         return method
     return wrapped
 
@@ -739,8 +3306,9 @@ def post(url):
     """Registers a method as capable of processing POST requests."""
     def wrapped(method):
         # Register.
-        re_url = re.compile("^%s$" % add_slash(url))
+        re_url = compile_url(url)
         REQUEST_MAPPINGS['POST'].append((re_url, url, method))
+        routes_changed()
         return method
     return wrapped
 
@@ -749,19 +3317,37 @@ def put(url):
     """Registers a method as capable of processing PUT requests."""
     def wrapped(method):
         # Register.
-        re_url = re.compile("^%s$" % add_slash(url))
+        re_url = compile_url(url)
         REQUEST_MAPPINGS['PUT'].append((re_url, url, method))
+        routes_changed()
         new.status = 201
         return method
     return wrapped
 
 
+def head(url):
+    """
+    Registers a method as capable of processing HEAD requests.
+
+    Only needed to override the default, which is to run the GET handler &
+    drop the body.
+    """
+    def wrapped(method):
+        # Register.
+        re_url = compile_url(url)
+        REQUEST_MAPPINGS['HEAD'].append((re_url, url, method))
+        routes_changed()
+        return method
+    return wrapped
+
+
 def delete(url):
     """Registers a method as capable of processing DELETE requests."""
     def wrapped(method):
         # Register.
-        re_url = re.compile("^%s$" % add_slash(url))
+        re_url = compile_url(url)
         REQUEST_MAPPINGS['DELETE'].append((re_url, url, method))
+        routes_changed()
         return method
     return wrapped
 
@@ -777,6 +3363,12 @@ def error(code):
 
 # Error handlers
 
+@error(400)
+def bad_request(request, exception):
+    response = Response('Bad Request', status=400, content_type='text/plain')
+    return response.send(request._start_response)
+
+
 @error(403)
 def forbidden(request, exception):
     response = Response('Forbidden', status=403, content_type='text/plain')
@@ -789,12 +3381,55 @@ def not_found(request, exception):
     return response.send(request._start_response)
 
 
+@error(413)
+def request_entity_too_large(request, exception):
+    response = Response('Request Entity Too Large', status=413, content_type='text/plain')
+    return response.send(request._start_response)
+
+
+@error(503)
+def service_unavailable(request, exception):
+    headers = []
+    retry_after = getattr(exception, 'retry_after', None)
+
+    if retry_after is not None:
+        headers.append(('Retry-After', str(int(retry_after))))
+
+    response = Response('Service Unavailable', status=503, content_type='text/plain', headers=headers)
+    return response.send(request._start_response)
+
+
 @error(500)
 def app_error(request, exception):
     response = Response('Application Error', status=500, content_type='text/plain')
     return response.send(request._start_response)
 
 
+@error(304)
+def not_modified(request, exception):
+    headers = getattr(exception, 'headers', None)
+
+    if not isinstance(headers, HTTPHeaders):
+        headers = HTTPHeaders()
+
+        for name, value in getattr(exception, 'headers', None) or []:
+            headers.add(name, value)
+
+    if getattr(exception, 'etag', None) is not None and not 'ETag' in headers:
+        headers['ETag'] = exception.etag
+
+    if getattr(exception, 'last_modified', None) is not None and not 'Last-Modified' in headers:
+        last_modified = exception.last_modified
+
+        if not isinstance(last_modified, basestring_type):
+            last_modified = format_timestamp(last_modified)
+
+        headers['Last-Modified'] = last_modified
+
+    response = not_modified_response(request, headers, getattr(exception, 'content_type', None))
+    return response.send(request._start_response)
+
+
 @error(302)
 def redirect(request, exception):
     response = Response('', status=302, content_type='text/plain', headers=[('Location', exception.url)])
@@ -809,6 +3444,170 @@ def wsgiref_adapter(host, port):
     srv.serve_forever()
 
 
+# Threads the ``threaded`` server handles connections on.
+THREADED_WORKERS = 10
+
+# Accepted connections that can wait for a free thread. Once it's full, new
+# connections wait in the listen backlog.
+THREADED_QUEUE_SIZE = 64
+
+# Seconds an idle keep-alive connection holds its thread.
+THREADED_KEEPALIVE_TIMEOUT = 5
+
+
+class BoundedInput(object):
+    """
+    Keeps reads of ``wsgi.input`` within the request body, so they can't
+    run into the next request on a keep-alive connection.
+    """
+    __slots__ = ('stream', 'remaining')
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.stream.readline(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=None):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self, limit=64 * 1024):
+        """Reads & discards what's left, up to ``limit`` bytes. Returns ``True`` if it all went."""
+        while 0 < self.remaining <= limit:
+            if not self.read(min(self.remaining, CHUNK_SIZE)):
+                break
+
+        return self.remaining == 0
+
+
+def threaded_adapter(host, port):
+    """
+    Like ``wsgiref``, but handles connections on a fixed pool of
+    ``THREADED_WORKERS`` threads & supports keep-alive.
+    """
+    import Queue
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler
+
+    class KeepAliveServerHandler(ServerHandler):
+        http_version = '1.1'
+
+        def cleanup_headers(self):
+            ServerHandler.cleanup_headers(self)
+            request_handler = self.request_handler
+
+            if not 'Content-Length' in self.headers and request_handler.command != 'HEAD' \
+                    and not self.status[:3] in ('204', '304'):
+                # Without a length, the end of the body is the end of the
+                # connection.
+                request_handler.close_connection = 1
+
+            if request_handler.close_connection:
+                self.headers['Connection'] = 'close'
+
+    class KeepAliveRequestHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle(self):
+            self.close_connection = 1
+            self.handle_one_request()
+
+            while not self.close_connection:
+                self.handle_one_request()
+
+        def handle_one_request(self):
+            # Only an idle connection times out. Once a request starts, the
+            # app (& its body reads/writes) gets as long as it needs.
+            self.connection.settimeout(THREADED_KEEPALIVE_TIMEOUT)
+
+            try:
+                try:
+                    self.raw_requestline = self.rfile.readline(65537)
+                except socket.timeout:
+                    self.close_connection = 1
+                    return
+            finally:
+                self.connection.settimeout(None)
+
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                self.close_connection = 1
+                return
+
+            if not self.raw_requestline or not self.parse_request():
+                self.close_connection = 1
+                return
+
+            environ = self.get_environ()
+
+            if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+                # Can't tell where an unread chunked body ends.
+                self.close_connection = 1
+                body = None
+            else:
+                body = BoundedInput(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+
+            handler = KeepAliveServerHandler(body or self.rfile, self.wfile, self.get_stderr(), environ)
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+
+            if body is not None and not body.drain():
+                self.close_connection = 1
+
+            if self.server.connections.qsize():
+                # Others are waiting for a thread. Don't hold this one.
+                self.close_connection = 1
+
+    class ThreadPoolServer(WSGIServer):
+        def __init__(self, *args, **kwargs):
+            WSGIServer.__init__(self, *args, **kwargs)
+            self.connections = Queue.Queue(THREADED_QUEUE_SIZE)
+
+            for i in range(THREADED_WORKERS):
+                worker = threading.Thread(target=self.work)
+                worker.daemon = True
+                worker.start()
+
+        def process_request(self, request, client_address):
+            # Blocks while the queue is full, leaving connections in the
+            # listen backlog.
+            self.connections.put((request, client_address))
+
+        def work(self):
+            while True:
+                request, client_address = self.connections.get()
+
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+
+                self.shutdown_request(request)
+
+    srv = ThreadPoolServer((host, int(port)), KeepAliveRequestHandler)
+    srv.set_app(handle_request)
+    srv.serve_forever()
+
+
 def appengine_adapter(host, port):
     from google.appengine.ext.webapp import util
     util.run_wsgi_app(handle_request)
@@ -901,8 +3700,472 @@ def eventlet_adapter(host, port):
     wsgi.server(listen((host, int(port))), handle_request)
 
 
+# Threads the ``asyncio`` server runs synchronous handlers on.
+ASYNCIO_WORKERS = 32
+
+# Seconds an idle keep-alive connection is held open.
+ASYNCIO_KEEPALIVE_TIMEOUT = 15
+
+# Most header lines accepted per request.
+ASYNCIO_MAX_HEADERS = 100
+
+# Request bodies bigger than this (in bytes) are spooled to a temporary file.
+ASYNCIO_SPOOL_SIZE = 1024 * 1024
+
+
+def asyncio_environ(method, target, version, header_lines, host, port, peer):
+    """Builds a WSGI environ from a parsed request head."""
+    path, _, query = target.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': urllib.unquote(path),
+        'QUERY_STRING': query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': peer[0],
+        'REMOTE_PORT': str(peer[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.input_terminated': True,
+    }
+
+    for line in header_lines:
+        name, sep, value = line.partition(':')
+
+        if not sep:
+            raise BadRequest("Malformed header line.")
+
+        key = name.strip().upper().replace('-', '_')
+        value = value.strip()
+
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+
+        if key in environ:
+            environ[key] += ',' + value
+        else:
+            environ[key] = value
+
+    return environ
+
+
+def asyncio_keep_alive(environ):
+    """Checks if the client wants the connection kept open afterwards."""
+    connection = environ.get('HTTP_CONNECTION', '').lower()
+
+    if environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+        return 'close' not in connection
+
+    return 'keep-alive' in connection
+
+
+def asyncio_adapter(host, port):
+    """
+    Serves requests from a single event loop, so handlers that spend their
+    time waiting on I/O don't each hold a thread.
+
+    Coroutine handlers are awaited on the loop. Everything else (including
+    reading streamed response bodies, building bodies & error pages) runs on
+    a pool of ``ASYNCIO_WORKERS`` threads.
+
+    Requires the third-party ``trollius`` & ``futures`` packages, which are
+    not part of the standard library. ``trollius`` (a Python 2 port of
+    ``asyncio``) is deprecated & no longer maintained.
+    """
+    try:
+        import trollius as asyncio
+        from trollius import From, Return
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError, e:
+        raise RuntimeError("The asyncio server needs the 'trollius' & 'futures' packages (%s)." % e)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(ThreadPoolExecutor(ASYNCIO_WORKERS))
+
+    def error_body(exc_info, request, callback=None):
+        # Re-raise on the pool, so ``handle_error`` can log the traceback.
+        try:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        except Exception, e:
+            return head_body(request, handle_error(e, request, callback))
+
+    @asyncio.coroutine
+    def application(environ, start_response):
+        try:
+            request = REQUEST_CLASS(environ, start_response)
+        except Exception:
+            # Let the regular handler (& its error handling) deal with it.
+            body = yield From(loop.run_in_executor(None, handle_request, environ, start_response))
+            raise Return(body)
+
+        error = None
+
+        try:
+            found = match_url(request)
+        except Exception:
+            error = sys.exc_info()
+
+        if error is not None:
+            body = yield From(loop.run_in_executor(None, error_body, error, request))
+            raise Return(body)
+
+        if found is None or not is_coroutine_handler(found[0][2]):
+            body = yield From(loop.run_in_executor(None, dispatch_request, request, found))
+            raise Return(body)
+
+        (re_url, url, callback), kwargs = found
+        admission = ADMISSION
+        ticket = None
+
+        try:
+            try:
+                if admission is not None:
+                    # Waiting for a slot would block the loop.
+                    ticket = admission.admit(url, wait=False)
+
+                response = yield From(callback(request, **kwargs))
+            except Exception:
+                error = sys.exc_info()
+
+            # Conditional GETs, ETags, compression & error pages can all be
+            # slow, so build the body on the pool.
+            if error is not None:
+                body = yield From(loop.run_in_executor(None, error_body, error, request, callback))
+            else:
+                body = yield From(loop.run_in_executor(None, finish_response, request, response))
+        finally:
+            if ticket is not None:
+                admission.release(ticket)
+
+        raise Return(body)
+
+    @asyncio.coroutine
+    def read_chunked(reader, spool):
+        seen = 0
+
+        while True:
+            line = yield From(reader.readline())
+
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise BadRequest("Invalid chunk size in request body.")
+
+            if size <= 0:
+                while (yield From(reader.readline())).strip():
+                    pass
+
+                raise Return(seen)
+
+            seen += size
+
+            if MAX_BODY_SIZE is not None and seen > MAX_BODY_SIZE:
+                raise RequestEntityTooLarge("Request body is larger than %d bytes." % MAX_BODY_SIZE)
+
+            yield From(read_into(reader, spool, size))
+            yield From(reader.readline())
+
+    @asyncio.coroutine
+    def read_into(reader, spool, size):
+        while size > 0:
+            data = yield From(reader.readexactly(min(size, CHUNK_SIZE)))
+            spool.write(data)
+            size -= len(data)
+
+    @asyncio.coroutine
+    def write_body(writer, body):
+        if isinstance(body, list):
+            # Already buffered.
+            for chunk in body:
+                if chunk:
+                    writer.write(chunk)
+                    yield From(writer.drain())
+
+            return
+
+        # Generators, files & ranges may block while producing chunks, so
+        # pull them on the pool rather than stall every connection.
+        chunks = iter(body)
+        done = object()
+
+        while True:
+            chunk = yield From(loop.run_in_executor(None, next, chunks, done))
+
+            if chunk is done:
+                break
+
+            if chunk:
+                writer.write(chunk)
+                yield From(writer.drain())
+
+    @asyncio.coroutine
+    def serve(reader, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+
+        try:
+            while True:
+                try:
+                    line = yield From(asyncio.wait_for(reader.readline(), ASYNCIO_KEEPALIVE_TIMEOUT))
+                except asyncio.TimeoutError:
+                    break
+
+                if not line:
+                    break
+
+                if not line.strip():
+                    continue
+
+                parts = line.split()
+
+                if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+                    writer.write(b'HTTP/1.0 400 BAD REQUEST\r\nConnection: close\r\n\r\n')
+                    break
+
+                header_lines = []
+
+                while True:
+                    line = yield From(reader.readline())
+
+                    if not line.strip():
+                        break
+
+                    if len(header_lines) >= ASYNCIO_MAX_HEADERS:
+                        raise BadRequest("Too many headers.")
+
+                    header_lines.append(line)
+
+                environ = asyncio_environ(parts[0], parts[1], parts[2], header_lines, host, port, peer)
+                keep_alive = asyncio_keep_alive(environ)
+                state = {}
+
+                def start_response(status, headers, exc_info=None):
+                    state['status'] = status
+                    state['headers'] = headers
+                    return state.setdefault('written', []).append
+
+                # Large bodies go to disk, so an upload isn't held in memory.
+                spool = tempfile.SpooledTemporaryFile(max_size=ASYNCIO_SPOOL_SIZE)
+                environ['wsgi.input'] = spool
+
+                error = None
+
+                try:
+                    if 'chunked' in environ.pop('HTTP_TRANSFER_ENCODING', '').lower():
+                        length = yield From(read_chunked(reader, spool))
+                        environ['CONTENT_LENGTH'] = str(length)
+                    else:
+                        length = int(environ.get('CONTENT_LENGTH') or 0)
+
+                        if MAX_BODY_SIZE is not None and length > MAX_BODY_SIZE:
+                            raise RequestEntityTooLarge("Request body is larger than %d bytes." % MAX_BODY_SIZE)
+
+                        yield From(read_into(reader, spool, length))
+                except RequestError:
+                    # The rest of the body is still on the wire, so the
+                    # connection can't be reused.
+                    spool.close()
+                    environ['wsgi.input'] = StringIO.StringIO()
+                    error = sys.exc_info()
+                    keep_alive = False
+                except BaseException:
+                    spool.close()
+                    raise
+
+                if error is not None:
+                    body = yield From(loop.run_in_executor(None, error_body, error, REQUEST_CLASS(environ, start_response)))
+                else:
+                    spool.seek(0)
+                    body = yield From(application(environ, start_response))
+
+                try:
+                    headers = state['headers']
+                    names = set(name.lower() for name, value in headers)
+                    no_body = environ['REQUEST_METHOD'] == 'HEAD' or state['status'][:3] in ('204', '304') or state['status'][0] == '1'
+
+                    if 'content-length' not in names and not no_body:
+                        keep_alive = False
+
+                    head = ['HTTP/1.1 %s' % state['status']]
+                    head.extend('%s: %s' % (name, value) for name, value in headers)
+
+                    if 'date' not in names:
+                        head.append('Date: %s' % email.utils.formatdate(usegmt=True))
+
+                    if not keep_alive:
+                        head.append('Connection: close')
+
+                    writer.write(b'\r\n'.join(head) + b'\r\n\r\n')
+
+                    for chunk in state.get('written', []):
+                        writer.write(chunk)
+
+                    yield From(write_body(writer, body))
+                finally:
+                    if hasattr(body, 'close'):
+                        body.close()
+
+                    spool.close()
+
+                yield From(writer.drain())
+
+                if not keep_alive:
+                    break
+        except (BadRequest, ValueError, asyncio.IncompleteReadError):
+            writer.write(b'HTTP/1.0 400 BAD REQUEST\r\nConnection: close\r\n\r\n')
+        except (IOError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    server = loop.run_until_complete(asyncio.start_server(serve, host, int(port)))
+
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+
+
+# Worker processes the ``prefork`` server runs. ``None`` means one per CPU.
+PREFORK_WORKERS = None
+
+# Requests a ``prefork`` worker serves before it's replaced, to cap the
+# damage from leaks. ``None`` means never.
+PREFORK_MAX_REQUESTS = None
+
+
+def prefork_socket(host, port, reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    sock.bind((host, int(port)))
+    sock.listen(128)
+    return sock
+
+
+def prefork_worker(host, port, sock, max_requests):
+    """Serves requests in a forked worker. Never returns."""
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+    status = 0
+
+    try:
+        srv = WSGIServer((host, int(port)), WSGIRequestHandler, bind_and_activate=False)
+        srv.socket.close()
+        srv.socket = sock
+        srv.server_address = sock.getsockname()
+        srv.server_name = socket.getfqdn(host)
+        srv.server_port = int(port)
+        srv.setup_environ()
+        srv.set_app(handle_request)
+
+        if max_requests is None:
+            srv.serve_forever()
+        else:
+            # Stagger recycling, so the workers don't all restart at once.
+            max_requests += random.randint(0, max_requests // 10)
+
+            for i in xrange(max_requests):
+                srv.handle_request()
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def prefork_adapter(host, port):
+    """
+    Forks ``PREFORK_WORKERS`` processes to serve requests on, restarting any
+    that exit.
+
+    Routes are compiled first, so the workers share them copy-on-write.
+    Where ``SO_REUSEPORT`` is available, each worker gets its own socket &
+    the kernel balances connections between them. The sockets stay open in
+    this process, so connections waiting on a worker that's being replaced
+    are picked up by its replacement rather than dropped.
+    """
+    import signal
+
+    workers = PREFORK_WORKERS
+
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+
+    for method in REQUEST_MAPPINGS:
+        compile_routes(method)
+
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sockets = [prefork_socket(host, port, reuse_port=True) for i in range(workers)]
+    else:
+        sockets = [prefork_socket(host, port)] * workers
+
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            prefork_worker(host, port, sockets[slot], PREFORK_MAX_REQUESTS)
+
+        children[pid] = (slot, time.time())
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        for slot in range(workers):
+            spawn(slot)
+
+        while True:
+            pid, status = os.wait()
+
+            if not pid in children:
+                continue
+
+            slot, started = children.pop(pid)
+
+            if status and time.time() - started < 1:
+                # Crashing on startup. Don't spin. (A clean exit is just a
+                # worker recycling after ``PREFORK_MAX_REQUESTS``.)
+                time.sleep(1)
+
+            spawn(slot)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+
 WSGI_ADAPTERS = {
     'wsgiref': wsgiref_adapter,
+    'threaded': threaded_adapter,
+    'asyncio': asyncio_adapter,
+    'prefork': prefork_adapter,
     'appengine': appengine_adapter,
     'cherrypy': cherrypy_adapter,
     'flup': flup_adapter,
@@ -916,13 +4179,23 @@ WSGI_ADAPTERS = {
 }
 
 
+# Options ``run_itty`` accepts (& reads from a config module) to tune the
+# built-in servers, with the settings they set.
+SERVER_OPTIONS = {
+    'threads': 'THREADED_WORKERS',
+    'queue_size': 'THREADED_QUEUE_SIZE',
+    'keepalive_timeout': 'THREADED_KEEPALIVE_TIMEOUT',
+    'workers': 'PREFORK_WORKERS',
+    'max_requests': 'PREFORK_MAX_REQUESTS',
+}
+
 COOKIE_SECRET = None
 
 # Server
 
 
 def run_itty(server='wsgiref', host='localhost', port=8080, config=None,
-    cookie_secret=None):
+    cookie_secret=None, **options):
     """
     Runs the itty web server.
 
@@ -931,10 +4204,10 @@ def run_itty(server='wsgiref', host='localhost', port=8080, config=None,
 
     By default, uses Python's built-in wsgiref implementation. Specify a server
     name from WSGI_ADAPTERS to use an alternate WSGI server.
-    """
-    if not server in WSGI_ADAPTERS:
-        raise RuntimeError("Server '%s' is not a valid server. Please choose a different server." % server)
 
+    Any options from SERVER_OPTIONS (like ``threads`` & ``queue_size`` for
+    the ``threaded`` server) may also be passed, or set in the config.
+    """
     if config is not None:
         # We'll let ImportErrors bubble up.
         config_options = __import__(config)
@@ -942,6 +4215,19 @@ def run_itty(server='wsgiref', host='localhost', port=8080, config=None,
         port = getattr(config_options, 'port', port)
         server = getattr(config_options, 'server', server)
 
+        for name in SERVER_OPTIONS:
+            if hasattr(config_options, name):
+                options[name] = getattr(config_options, name)
+
+    if not server in WSGI_ADAPTERS:
+        raise RuntimeError("Server '%s' is not a valid server. Please choose a different server." % server)
+
+    for name, value in options.items():
+        if not name in SERVER_OPTIONS:
+            raise RuntimeError("'%s' is not a valid server option. Please choose from: %s." % (name, ', '.join(sorted(SERVER_OPTIONS))))
+
+        globals()[SERVER_OPTIONS[name]] = value
+
     # AppEngine seems to echo everything, even though it shouldn't. Accomodate.
     if server != 'appengine':
         print 'itty starting up (using %s)...' % server
@@ -951,6 +4237,7 @@ def run_itty(server='wsgiref', host='localhost', port=8080, config=None,
 
     global COOKIE_SECRET
     COOKIE_SECRET = cookie_secret or base64.b64encode(os.urandom(32))
+    _signer(COOKIE_SECRET)
 
     try:
         WSGI_ADAPTERS[server](host, port)